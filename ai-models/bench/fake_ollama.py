@@ -0,0 +1,182 @@
+"""Stand-in Ollama server for benchmarking llama-service without a GPU or network.
+
+Emulates /api/tags, /api/generate and /api/chat (or, with --no-chat-api, an
+older Ollama without it), streaming and non-streaming, with a configurable
+time to first token, token rate, response length and number of parallel
+generations (the OLLAMA_NUM_PARALLEL equivalent; further requests wait for a
+slot). Final responses carry Ollama's timing and token
+count fields so /metrics and usage reporting see realistic values.
+
+    python fake_ollama.py --port 11434 --tokens-per-second 40 --first-token-latency 0.2
+"""
+import argparse
+import json
+import logging
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Iterator
+
+WORDS = (
+    "the cell membrane controls what enters and leaves while energy from light drives "
+    "photosynthesis in the chloroplast and respiration releases it in the mitochondria"
+).split()
+
+
+class FakeOllama:
+    """Generation timing model shared by all request handlers"""
+
+    def __init__(self, model: str, first_token_latency: float, tokens_per_second: float,
+                 response_tokens: int, parallel: int, chat_api: bool = True):
+        self.model = model
+        self.chat_api = chat_api
+        self.first_token_latency = first_token_latency
+        self.tokens_per_second = tokens_per_second
+        self.response_tokens = response_tokens
+        self.slots = threading.Semaphore(parallel)
+
+    def tokens(self, options: Dict) -> Iterator[str]:
+        count = min(self.response_tokens, options.get("num_predict") or self.response_tokens)
+        for i in range(count):
+            yield ("" if i == 0 else " ") + WORDS[i % len(WORDS)]
+
+    def generate(self, prompt: str, options: Dict) -> Iterator[Dict]:
+        """Yield token events paced at the configured rate, then the final statistics"""
+        with self.slots:
+            started = time.perf_counter()
+            time.sleep(self.first_token_latency)
+            prompt_eval = time.perf_counter() - started
+
+            eval_started = time.perf_counter()
+            count = 0
+            for token in self.tokens(options):
+                if count:
+                    time.sleep(1.0 / self.tokens_per_second)
+                count += 1
+                yield {"token": token}
+
+            eval_duration = time.perf_counter() - eval_started
+            yield {
+                "done": True,
+                "total_duration": int((time.perf_counter() - started) * 1e9),
+                "load_duration": 0,
+                "prompt_eval_count": len(prompt.split()),
+                "prompt_eval_duration": int(prompt_eval * 1e9),
+                "eval_count": count,
+                "eval_duration": int(eval_duration * 1e9)
+            }
+
+
+def make_handler(ollama: FakeOllama):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            pass
+
+        def send_json(self, body: Dict, status: int = 200):
+            data = json.dumps(body).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def send_chunk(self, body: Dict):
+            line = (json.dumps(body) + "\n").encode("utf-8")
+            self.wfile.write(b"%x\r\n%s\r\n" % (len(line), line))
+            self.wfile.flush()
+
+        def do_GET(self):
+            if self.path == "/api/tags":
+                self.send_json({"models": [{
+                    "name": f"{ollama.model}:latest",
+                    "modified_at": "2024-01-01T00:00:00Z",
+                    "size": 4661224676
+                }]})
+            else:
+                self.send_json({"error": "not found"}, 404)
+
+        def do_POST(self):
+            # Read the body first so a kept-alive connection stays in sync even on a 404
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            if self.path not in ("/api/generate", "/api/chat") or (self.path == "/api/chat" and not ollama.chat_api):
+                self.send_json({"error": "not found"}, 404)
+                return
+
+            chat = self.path == "/api/chat"
+            if chat:
+                prompt = " ".join(message.get("content", "") for message in body.get("messages", []))
+            else:
+                prompt = body.get("prompt", "")
+
+            def shape(event: Dict) -> Dict:
+                text = event.pop("token", "")
+                shaped = {"model": body.get("model", ollama.model), "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ")}
+                if chat:
+                    shaped["message"] = {"role": "assistant", "content": text}
+                else:
+                    shaped["response"] = text
+                shaped["done"] = event.pop("done", False)
+                shaped.update(event)
+                return shaped
+
+            events = ollama.generate(prompt, body.get("options", {}))
+            if body.get("stream", True):
+                self.send_response(200)
+                self.send_header("Content-Type", "application/x-ndjson")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                try:
+                    for event in events:
+                        self.send_chunk(shape(event))
+                    self.wfile.write(b"0\r\n\r\n")
+                except (BrokenPipeError, ConnectionResetError):
+                    # The client went away; stop generating like Ollama does
+                    events.close()
+                return
+
+            text = ""
+            for event in events:
+                if event.get("done"):
+                    final = shape(event)
+                else:
+                    text += event["token"]
+            if chat:
+                final["message"]["content"] = text
+            else:
+                final["response"] = text
+            self.send_json(final)
+
+    return Handler
+
+
+def serve(host: str, port: int, ollama: FakeOllama) -> ThreadingHTTPServer:
+    """Create the server; the caller runs serve_forever (or does so in a thread)"""
+    server = ThreadingHTTPServer((host, port), make_handler(ollama))
+    server.daemon_threads = True
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11434)
+    parser.add_argument("--model", default="llama3.1")
+    parser.add_argument("--first-token-latency", type=float, default=0.1, help="Seconds of prompt evaluation before the first token")
+    parser.add_argument("--tokens-per-second", type=float, default=50.0)
+    parser.add_argument("--response-tokens", type=int, default=32, help="Tokens per response, capped by num_predict")
+    parser.add_argument("--parallel", type=int, default=4, help="Generations served at once; the rest queue")
+    parser.add_argument("--no-chat-api", action="store_true", help="Answer /api/chat with 404 like Ollama before 0.1.14")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    ollama = FakeOllama(args.model, args.first_token_latency, args.tokens_per_second, args.response_tokens,
+                        args.parallel, chat_api=not args.no_chat_api)
+    server = serve(args.host, args.port, ollama)
+    logging.info(f"Fake Ollama listening on http://{args.host}:{args.port}")
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,218 @@
+"""Closed-loop load scenarios for llama-service and question-generator.
+
+Each scenario sends requests from a fixed number of concurrent clients, each
+issuing its next request as soon as the previous one finishes, and reports
+p50/p95/p99 latency, throughput and errors per concurrency level. Streaming
+scenarios also report time to first byte. Payloads vary per request so
+caches and request coalescing do not hide the model's cost.
+
+    python load_test.py --scenarios generate questions --concurrency 1 4 16 --output report.json
+"""
+import argparse
+import json
+import logging
+import math
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+
+import requests
+
+TOPICS = [
+    "Photosynthesis converts light energy into chemical energy. Chlorophyll in the chloroplasts absorbs sunlight.",
+    "Mitochondria release stored energy through cellular respiration, producing adenosine triphosphate.",
+    "The French Revolution began in 1789 and transformed the political landscape of Europe.",
+    "Newton described gravity as a force that attracts every mass towards every other mass.",
+    "Einstein later explained gravitation as the curvature of spacetime in general relativity.",
+]
+
+
+def lecture(i: int, sentences: int = 6) -> str:
+    """A context that differs per request index"""
+    parts = [TOPICS[(i + j) % len(TOPICS)] for j in range(sentences)]
+    return f"Lecture {i}. " + " ".join(parts)
+
+
+def tutoring_session(i: int, turns: int = 40) -> List[Dict]:
+    """A long conversation ending in a new question, to exercise history compaction"""
+    messages = [{"role": "system", "content": "You are a helpful tutor."}]
+    for turn in range(turns):
+        messages.append({"role": "user", "content": f"Session {i}, question {turn}: {TOPICS[turn % len(TOPICS)]} Why?"})
+        messages.append({"role": "assistant", "content": " ".join(TOPICS[(turn + 1) % len(TOPICS)] for _ in range(3))})
+    messages.append({"role": "user", "content": f"Session {i}: summarize what we covered."})
+    return messages
+
+
+class Scenario:
+    """One endpoint under load: which service it targets and how to build request i"""
+
+    def __init__(self, name: str, service: str, path: str, payload: Callable[[int], Dict], stream: bool = False):
+        self.name = name
+        self.service = service
+        self.path = path
+        self.payload = payload
+        self.stream = stream
+
+
+SCENARIOS = {
+    scenario.name: scenario for scenario in [
+        Scenario("generate", "llama", "/generate",
+                 lambda i: {"prompt": f"Explain topic {i}: {TOPICS[i % len(TOPICS)]}", "max_tokens": 64}),
+        Scenario("generate_stream", "llama", "/generate",
+                 lambda i: {"prompt": f"Explain topic {i}: {TOPICS[i % len(TOPICS)]}", "max_tokens": 64, "stream": True},
+                 stream=True),
+        Scenario("chat", "llama", "/chat/completions",
+                 lambda i: {"messages": [
+                     {"role": "system", "content": "You are a helpful tutor."},
+                     {"role": "user", "content": f"Question {i}: summarize {TOPICS[i % len(TOPICS)]}"}
+                 ], "max_tokens": 64}),
+        Scenario("chat_stream", "llama", "/chat/completions",
+                 lambda i: {"messages": [
+                     {"role": "system", "content": "You are a helpful tutor."},
+                     {"role": "user", "content": f"Question {i}: summarize {TOPICS[i % len(TOPICS)]}"}
+                 ], "max_tokens": 64, "stream": True},
+                 stream=True),
+        Scenario("chat_long", "llama", "/chat/completions",
+                 lambda i: {"messages": tutoring_session(i), "max_tokens": 64}),
+        Scenario("questions", "qg", "/generate-questions",
+                 lambda i: {"context": lecture(i), "max_questions": 5}),
+        Scenario("batch_questions", "qg", "/generate-batch-questions",
+                 lambda i: {"contexts": [lecture(i * 4 + j) for j in range(4)], "max_questions_per_context": 3}),
+    ]
+}
+
+
+def percentile(values: List[float], q: float) -> Optional[float]:
+    """Nearest-rank percentile of an unsorted list"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, math.ceil(q / 100.0 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def summarize(samples: List[float]) -> Dict:
+    """Latency summary in milliseconds"""
+    if not samples:
+        return {}
+    return {
+        "p50_ms": round(percentile(samples, 50) * 1000.0, 2),
+        "p95_ms": round(percentile(samples, 95) * 1000.0, 2),
+        "p99_ms": round(percentile(samples, 99) * 1000.0, 2),
+        "mean_ms": round(sum(samples) / len(samples) * 1000.0, 2),
+        "max_ms": round(max(samples) * 1000.0, 2)
+    }
+
+
+def send(session: requests.Session, url: str, payload: Dict, stream: bool, timeout: float) -> Dict:
+    """Send one request and time it; streaming responses are read to the end"""
+    started = time.perf_counter()
+    first_byte = None
+    try:
+        response = session.post(url, json=payload, stream=stream, timeout=timeout)
+        if stream:
+            for chunk in response.iter_content(chunk_size=None):
+                if first_byte is None and chunk:
+                    first_byte = time.perf_counter() - started
+        else:
+            response.content
+        error = None if response.status_code == 200 else f"http_{response.status_code}"
+    except requests.exceptions.RequestException as e:
+        error = type(e).__name__
+
+    return {"latency": time.perf_counter() - started, "first_byte": first_byte, "error": error}
+
+
+def run_level(scenario: Scenario, base_url: str, concurrency: int, requests_per_level: int,
+              timeout: float, offset: int = 0) -> Dict:
+    """Run one concurrency level and summarize it"""
+    local = threading.local()
+
+    def worker(i: int) -> Dict:
+        if not hasattr(local, "session"):
+            local.session = requests.Session()
+        return send(local.session, f"{base_url}{scenario.path}", scenario.payload(offset + i), scenario.stream, timeout)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(worker, range(requests_per_level)))
+    elapsed = time.perf_counter() - started
+
+    succeeded = [r for r in results if r["error"] is None]
+    errors = {}
+    for r in results:
+        if r["error"] is not None:
+            errors[r["error"]] = errors.get(r["error"], 0) + 1
+
+    level = {
+        "concurrency": concurrency,
+        "requests": len(results),
+        "succeeded": len(succeeded),
+        "errors": errors,
+        "elapsed_seconds": round(elapsed, 3),
+        "throughput_rps": round(len(succeeded) / elapsed, 3) if elapsed else 0.0,
+        "latency": summarize([r["latency"] for r in succeeded])
+    }
+    if scenario.stream:
+        level["first_byte"] = summarize([r["first_byte"] for r in succeeded if r["first_byte"] is not None])
+    return level
+
+
+def run_scenarios(names: List[str], urls: Dict[str, str], concurrency_levels: List[int],
+                  requests_per_level: int, warmup: int = 2, timeout: float = 300.0) -> Dict:
+    """Run every scenario at every concurrency level and return the JSON report"""
+    report = {"started_at": int(time.time()), "scenarios": []}
+    offset = 0
+    for name in names:
+        scenario = SCENARIOS[name]
+        base_url = urls[scenario.service]
+        logging.info(f"Running {name} against {base_url}{scenario.path}")
+
+        if warmup:
+            run_level(scenario, base_url, 1, warmup, timeout, offset=10 ** 6)
+
+        levels = []
+        for concurrency in concurrency_levels:
+            count = max(requests_per_level, concurrency)
+            levels.append(run_level(scenario, base_url, concurrency, count, timeout, offset))
+            offset += count
+            logging.info(f"  concurrency {concurrency}: {levels[-1]['throughput_rps']} req/s, "
+                         f"p95 {levels[-1]['latency'].get('p95_ms')} ms")
+
+        report["scenarios"].append({
+            "name": name,
+            "endpoint": scenario.path,
+            "stream": scenario.stream,
+            "levels": levels
+        })
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--llama-url", default="http://localhost:8002")
+    parser.add_argument("--qg-url", default="http://localhost:8001")
+    parser.add_argument("--scenarios", nargs="+", default=list(SCENARIOS), choices=list(SCENARIOS))
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--requests", type=int, default=32, help="Requests per concurrency level")
+    parser.add_argument("--warmup", type=int, default=2, help="Unmeasured requests before each scenario")
+    parser.add_argument("--timeout", type=float, default=300.0)
+    parser.add_argument("--output", help="Write the JSON report here as well as to stdout")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    report = run_scenarios(
+        args.scenarios, {"llama": args.llama_url, "qg": args.qg_url},
+        args.concurrency, args.requests, args.warmup, args.timeout
+    )
+
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,160 @@
+"""Run the full benchmark offline: fake Ollama, tiny T5, both services and the load scenarios.
+
+Starts the stand-in Ollama server in-process, builds a tiny random T5
+snapshot, launches llama-service and question-generator as subprocesses on
+local ports pointed at them, waits for both to be ready, runs the load
+scenarios and writes one JSON report. Nothing touches the network, so the
+same command catches throughput and latency regressions before a deploy.
+
+    python run_bench.py --concurrency 1 4 16 --output bench_report.json
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from typing import Dict, List
+
+import requests
+
+from fake_ollama import FakeOllama, serve
+from load_test import SCENARIOS, run_scenarios
+from tiny_t5 import build_snapshot
+
+AI_MODELS_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# The ports both services listen on
+LLAMA_PORT = 8002
+QG_PORT = 8001
+
+
+def start_service(script: str, env: Dict[str, str], log_path: str) -> subprocess.Popen:
+    """Launch a service script from its own directory, logging to a file"""
+    log = open(log_path, "w")
+    return subprocess.Popen(
+        [sys.executable, os.path.basename(script)],
+        cwd=os.path.dirname(script),
+        env={**os.environ, **env},
+        stdout=log,
+        stderr=subprocess.STDOUT
+    )
+
+
+def wait_ready(url: str, process: subprocess.Popen, timeout: float):
+    """Poll url until it returns 200, failing early if the process exits"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"{url} exited with status {process.returncode} before becoming ready")
+        try:
+            if requests.get(url, timeout=2).status_code == 200:
+                return
+        except requests.exceptions.RequestException:
+            pass
+        time.sleep(0.5)
+    raise RuntimeError(f"{url} was not ready after {timeout}s")
+
+
+def stop(processes: List[subprocess.Popen]):
+    for process in processes:
+        if process.poll() is None:
+            process.terminate()
+    for process in processes:
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scenarios", nargs="+", default=list(SCENARIOS), choices=list(SCENARIOS))
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--requests", type=int, default=32, help="Requests per concurrency level")
+    parser.add_argument("--llama-mode", choices=["flask", "async"], default="flask",
+                        help="Serve llama-service with llama_service.py or llama_async.py")
+    parser.add_argument("--qg-workers", type=int, default=1, help="QG_WORKERS for question_service")
+    parser.add_argument("--ollama-port", type=int, default=11500)
+    parser.add_argument("--first-token-latency", type=float, default=0.1)
+    parser.add_argument("--tokens-per-second", type=float, default=50.0)
+    parser.add_argument("--response-tokens", type=int, default=32)
+    parser.add_argument("--ollama-parallel", type=int, default=4)
+    parser.add_argument("--model-path", help="T5 snapshot to serve instead of building a tiny one")
+    parser.add_argument("--output", default="bench_report.json")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    workdir = tempfile.mkdtemp(prefix="qubits-bench-")
+
+    ollama = FakeOllama("llama3.1", args.first_token_latency, args.tokens_per_second,
+                        args.response_tokens, args.ollama_parallel)
+    ollama_server = serve("127.0.0.1", args.ollama_port, ollama)
+    threading.Thread(target=ollama_server.serve_forever, daemon=True).start()
+
+    model_path = args.model_path
+    if model_path is None:
+        model_path = os.path.join(workdir, "tiny-t5")
+        build_snapshot(model_path)
+
+    wanted = {SCENARIOS[name].service for name in args.scenarios}
+    offline = {"HF_HUB_OFFLINE": "1", "TRANSFORMERS_OFFLINE": "1", "PYTHONUNBUFFERED": "1"}
+    processes = []
+    try:
+        if "llama" in wanted:
+            script = "llama_async.py" if args.llama_mode == "async" else "llama_service.py"
+            llama = start_service(
+                os.path.join(AI_MODELS_DIR, "llama-service", script),
+                {**offline, "OLLAMA_URL": f"http://127.0.0.1:{args.ollama_port}"},
+                os.path.join(workdir, "llama-service.log")
+            )
+            processes.append(llama)
+            wait_ready(f"http://127.0.0.1:{LLAMA_PORT}/health", llama, 60)
+
+        if "qg" in wanted:
+            qg = start_service(
+                os.path.join(AI_MODELS_DIR, "question-generator", "question_service.py"),
+                # An empty cache path disables the question cache so every request runs the model
+                {**offline, "QG_MODEL_PATH": model_path, "QG_CACHE_PATH": "", "QG_WORKERS": str(args.qg_workers)},
+                os.path.join(workdir, "question-service.log")
+            )
+            processes.append(qg)
+            wait_ready(f"http://127.0.0.1:{QG_PORT}/ready", qg, 300)
+
+        report = run_scenarios(
+            args.scenarios,
+            {"llama": f"http://127.0.0.1:{LLAMA_PORT}", "qg": f"http://127.0.0.1:{QG_PORT}"},
+            args.concurrency, args.requests
+        )
+    finally:
+        stop(processes)
+        ollama_server.shutdown()
+
+    report["environment"] = {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+        "llama_mode": args.llama_mode,
+        "qg_workers": args.qg_workers,
+        "model_path": args.model_path or "tiny-t5",
+        "fake_ollama": {
+            "first_token_latency": args.first_token_latency,
+            "tokens_per_second": args.tokens_per_second,
+            "response_tokens": args.response_tokens,
+            "parallel": args.ollama_parallel
+        },
+        "logs": workdir
+    }
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+        f.write("\n")
+    logging.info(f"Report written to {args.output}; service logs in {workdir}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+"""Build a tiny randomly initialized T5 snapshot for benchmarking question_service offline.
+
+The snapshot has the same layout as one written by --export-snapshot, so
+question_service loads it through QG_MODEL_PATH without touching the network.
+Its questions are gibberish; it exists to exercise chunking, batching,
+scheduling and serving overheads. Use --d-model and --layers to scale the
+per-token compute towards a real model.
+
+    python tiny_t5.py /tmp/tiny-t5
+    QG_MODEL_PATH=/tmp/tiny-t5 python ../question-generator/question_service.py
+"""
+import argparse
+import logging
+
+import torch
+from tokenizers import Tokenizer, models, pre_tokenizers, processors, trainers
+from transformers import PreTrainedTokenizerFast, T5Config, T5ForConditionalGeneration
+
+CORPUS = [
+    "answer: Photosynthesis context: Photosynthesis converts light energy into chemical energy in plants.",
+    "answer: Mitochondria context: Mitochondria release stored energy through cellular respiration.",
+    "answer: Newton context: Newton described gravity as a force between every mass and every other mass.",
+    "answer: Revolution context: The French Revolution began in 1789 and transformed Europe.",
+    "What is the role of chlorophyll in the chloroplast? Which process produces glucose?",
+    "Who described gravity? When did the revolution begin? Why does the cell need energy?",
+]
+
+
+def build_tokenizer(vocab_size: int) -> PreTrainedTokenizerFast:
+    """Train a word-piece tokenizer on a small built-in corpus; no download needed"""
+    tokenizer = Tokenizer(models.WordPiece(unk_token="<unk>"))
+    tokenizer.pre_tokenizer = pre_tokenizers.Whitespace()
+    trainer = trainers.WordPieceTrainer(vocab_size=vocab_size, special_tokens=["<pad>", "</s>", "<unk>"])
+    tokenizer.train_from_iterator(CORPUS * 20, trainer)
+    # T5 appends </s> to every encoder input
+    tokenizer.post_processor = processors.TemplateProcessing(single="$A </s>", special_tokens=[("</s>", 1)])
+    return PreTrainedTokenizerFast(tokenizer_object=tokenizer, pad_token="<pad>", eos_token="</s>", unk_token="<unk>")
+
+
+def build_snapshot(path: str, d_model: int = 64, layers: int = 2, vocab_size: int = 2000, seed: int = 0):
+    """Write a tokenizer and randomly initialized T5 to path"""
+    torch.manual_seed(seed)
+    tokenizer = build_tokenizer(vocab_size)
+    config = T5Config(
+        vocab_size=tokenizer.vocab_size,
+        d_model=d_model,
+        d_ff=d_model * 4,
+        d_kv=max(8, d_model // 4),
+        num_heads=4,
+        num_layers=layers,
+        decoder_start_token_id=tokenizer.pad_token_id,
+        pad_token_id=tokenizer.pad_token_id,
+        eos_token_id=tokenizer.eos_token_id
+    )
+    tokenizer.save_pretrained(path)
+    T5ForConditionalGeneration(config).save_pretrained(path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("path", help="Directory to write the snapshot to")
+    parser.add_argument("--d-model", type=int, default=64)
+    parser.add_argument("--layers", type=int, default=2)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    build_snapshot(args.path, args.d_model, args.layers, seed=args.seed)
+    logging.info(f"Tiny T5 snapshot written to {args.path}")
+
+
+if __name__ == '__main__':
+    main()
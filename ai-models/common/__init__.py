@@ -0,0 +1 @@
+# Code shared by question-generator and llama-service; each puts ai-models/ on sys.path to import it
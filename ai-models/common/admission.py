@@ -0,0 +1,301 @@
+import asyncio
+import math
+import os
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+from typing import Dict, List, Optional
+
+INTERACTIVE = "interactive"
+BATCH = "batch"
+PRIORITIES = (INTERACTIVE, BATCH)
+
+
+class Overloaded(Exception):
+    """Raised when a request cannot be admitted; carries the HTTP status and a Retry-After hint"""
+
+    def __init__(self, status: int, message: str, retry_after: float = 1.0):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+        self.retry_after = max(1, math.ceil(retry_after))
+
+
+class QueueClass:
+    """Scheduling settings of one priority class"""
+
+    def __init__(self, name: str, limit: int, weight: int, max_queue: int, deadline: float):
+        self.name = name
+        # Requests of this class running at once, within the controller's total
+        self.limit = limit
+        # Share of freed slots this class gets while several classes are waiting
+        self.weight = weight
+        self.max_queue = max_queue
+        # Seconds a request may wait for a slot before it is not worth starting
+        self.deadline = deadline
+
+
+def queue_classes_from_env(prefix: str, max_concurrent: int, batch_limit: int, interactive_queue: int,
+                           batch_queue: int, interactive_deadline: float, batch_deadline: float) -> List[QueueClass]:
+    """Interactive and batch classes; each setting can be overridden with {prefix}_{CLASS}_{SETTING}"""
+    def setting(name: str, key: str, default):
+        return type(default)(os.environ.get(f"{prefix}_{name.upper()}_{key}", default))
+
+    defaults = {
+        INTERACTIVE: (max_concurrent, 4, interactive_queue, interactive_deadline),
+        BATCH: (batch_limit, 1, batch_queue, batch_deadline),
+    }
+    return [
+        QueueClass(
+            name,
+            limit=setting(name, "LIMIT", limit),
+            weight=setting(name, "WEIGHT", weight),
+            max_queue=setting(name, "QUEUE", max_queue),
+            deadline=setting(name, "DEADLINE", float(deadline))
+        )
+        for name, (limit, weight, max_queue, deadline) in defaults.items()
+    ]
+
+
+class WeightedRoundRobin:
+    """Smooth weighted round robin: with weights 4 and 1, four picks of the first per pick of the second"""
+
+    def __init__(self, weights: Dict[str, int]):
+        self.weights = weights
+        self._credit = {name: 0 for name in weights}
+
+    def pick(self, eligible: List[str]) -> Optional[str]:
+        if not eligible:
+            return None
+        total = sum(self.weights[name] for name in eligible)
+        for name in eligible:
+            self._credit[name] += self.weights[name]
+        chosen = max(eligible, key=lambda name: self._credit[name])
+        self._credit[chosen] -= total
+        return chosen
+
+
+class Ticket:
+    """One request's place in the admission queue"""
+
+    def __init__(self, priority: str, cost: float):
+        self.priority = priority
+        self.cost = cost
+        self.enqueued_at = time.monotonic()
+        self.started_at = None
+        # Future resolved when an asyncio caller is granted its slot
+        self.waiter = None
+
+
+class AdmissionController:
+    """Admit work in two priority classes onto a fixed number of slots.
+
+    Interactive and batch requests wait in separate FIFO queues. Each class
+    has its own concurrency cap inside the total, so bulk work can never
+    occupy every slot, and when a slot frees up the next request is taken
+    from the waiting classes by weighted round robin, so interactive
+    requests are preferred without starving batch ones. A request's cost is
+    an estimate in work units (questions or tokens to generate); seconds per
+    unit is learned from finished requests. A request whose estimated queue
+    wait exceeds its class deadline is turned away up front with a
+    Retry-After hint rather than queued to time out.
+
+    metrics is the calling service's metrics module, which defines the
+    ADMISSION_* collectors under that service's metric names.
+    """
+
+    def __init__(self, max_concurrent: int, classes: List[QueueClass], seconds_per_unit: float, metrics):
+        self.max_concurrent = max_concurrent
+        self.metrics = metrics
+        self.classes = {queue_class.name: queue_class for queue_class in classes}
+        self.seconds_per_unit = seconds_per_unit
+        self._cond = threading.Condition()
+        self._queues = {name: deque() for name in self.classes}
+        self._running = {name: 0 for name in self.classes}
+        self._running_cost = {name: 0.0 for name in self.classes}
+        self._round_robin = WeightedRoundRobin({name: c.weight for name, c in self.classes.items()})
+        self._stats = {name: {"admitted": 0, "rejected": 0, "completed": 0} for name in self.classes}
+
+    def acquire(self, priority: str, cost: float) -> Ticket:
+        """Block until the request may run; raises Overloaded if it is turned away or times out"""
+        with self._cond:
+            ticket = self._enqueue(priority, cost)
+            deadline = ticket.enqueued_at + self.classes[priority].deadline
+            while ticket.started_at is None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._abandon(ticket)
+                    raise self._reject(priority, "timeout", 503, "Timed out waiting for a generation slot")
+                self._cond.wait(remaining)
+        self.metrics.ADMISSION_WAIT.labels(priority).observe(ticket.started_at - ticket.enqueued_at)
+        return ticket
+
+    def release(self, ticket: Ticket, observe: bool = True):
+        """Free a slot taken by acquire(); observe=False keeps failed requests out of the cost estimate"""
+        with self._cond:
+            name = ticket.priority
+            self._running[name] -= 1
+            self._running_cost[name] -= ticket.cost
+            self._stats[name]["completed"] += 1
+            if observe and ticket.cost > 0:
+                sample = (time.monotonic() - ticket.started_at) / ticket.cost
+                self.seconds_per_unit += 0.2 * (sample - self.seconds_per_unit)
+            self._dispatch()
+            self._cond.notify_all()
+
+    @contextmanager
+    def slot(self, priority: str, cost: float):
+        """Hold a slot for the duration of a with block"""
+        ticket = self.acquire(priority, cost)
+        observe = False
+        try:
+            yield ticket
+            observe = True
+        finally:
+            self.release(ticket, observe)
+
+    def estimate_wait(self, priority: str) -> float:
+        """Seconds a new request of this class would queue, from the queued work it has to wait behind"""
+        queue_class = self.classes[priority]
+        if not self._queues[priority] and self._has_slot(queue_class):
+            return 0.0
+        # Queued work of this class and of classes weighted at least as high goes first
+        ahead = sum(
+            ticket.cost
+            for name, queue in self._queues.items() if self.classes[name].weight >= queue_class.weight
+            for ticket in queue
+        )
+        capacity = max(1, min(queue_class.limit, self.max_concurrent))
+        # Running requests are half done on average
+        ahead += self._running_cost[priority] / 2
+        return ahead * self.seconds_per_unit / capacity
+
+    def _has_slot(self, queue_class: QueueClass) -> bool:
+        return (
+            sum(self._running.values()) < self.max_concurrent
+            and self._running[queue_class.name] < queue_class.limit
+        )
+
+    def check(self, priority: str):
+        """Raise Overloaded if a request of this class would be turned away now, without queueing it"""
+        with self._cond:
+            self._check(priority)
+
+    def _check(self, priority: str):
+        """Turn a request away if its queue is full or it would wait past its deadline; the caller holds the lock"""
+        queue_class = self.classes[priority]
+        if len(self._queues[priority]) >= queue_class.max_queue:
+            raise self._reject(priority, "queue_full", 429, f"Too many queued {priority} requests, retry later",
+                               self.estimate_wait(priority))
+
+        # Only the wait counts, as the request would time out in the queue; long runs are the class limit's concern
+        wait = self.estimate_wait(priority)
+        if wait > queue_class.deadline:
+            raise self._reject(
+                priority, "deadline", 429,
+                f"Estimated wait of {wait:.1f}s exceeds the {queue_class.deadline:.0f}s {priority} deadline, retry later",
+                wait
+            )
+
+    def _enqueue(self, priority: str, cost: float) -> Ticket:
+        """Queue a request after the admission checks; the caller holds the lock"""
+        self._check(priority)
+        ticket = Ticket(priority, cost)
+        self._queues[priority].append(ticket)
+        self._stats[priority]["admitted"] += 1
+        self._dispatch()
+        return ticket
+
+    def _abandon(self, ticket: Ticket):
+        """Drop a ticket that gave up while still queued"""
+        self._queues[ticket.priority].remove(ticket)
+        self._publish()
+
+    def _dispatch(self):
+        """Start queued requests while slots are free, choosing between classes by weight"""
+        while True:
+            eligible = [
+                name for name, queue in self._queues.items()
+                if queue and self._has_slot(self.classes[name])
+            ]
+            name = self._round_robin.pick(eligible)
+            if name is None:
+                break
+            ticket = self._queues[name].popleft()
+            ticket.started_at = time.monotonic()
+            self._running[name] += 1
+            self._running_cost[name] += ticket.cost
+            if ticket.waiter is not None and not ticket.waiter.done():
+                ticket.waiter.set_result(None)
+        self._publish()
+
+    def _reject(self, priority: str, reason: str, status: int, message: str, retry_after: float = 1.0) -> Overloaded:
+        self._stats[priority]["rejected"] += 1
+        self.metrics.ADMISSION_REJECTED.labels(priority, reason).inc()
+        return Overloaded(status, message, retry_after)
+
+    def _publish(self):
+        for name in self.classes:
+            self.metrics.ADMISSION_QUEUE_DEPTH.labels(name).set(len(self._queues[name]))
+            self.metrics.ADMISSION_ACTIVE.labels(name).set(self._running[name])
+
+    def stats(self) -> Dict:
+        """Queue depth, running requests and counters per class"""
+        with self._cond:
+            return {
+                "max_concurrent": self.max_concurrent,
+                "seconds_per_unit": round(self.seconds_per_unit, 4),
+                "classes": {
+                    name: {
+                        "limit": queue_class.limit,
+                        "weight": queue_class.weight,
+                        "deadline_seconds": queue_class.deadline,
+                        "queue_depth": len(self._queues[name]),
+                        "max_queue": queue_class.max_queue,
+                        "running": self._running[name],
+                        "estimated_wait_seconds": round(self.estimate_wait(name), 3),
+                        **self._stats[name]
+                    }
+                    for name, queue_class in self.classes.items()
+                }
+            }
+
+
+class AsyncAdmissionController(AdmissionController):
+    """asyncio counterpart of AdmissionController; waiting callers await a future instead of blocking"""
+
+    async def acquire(self, priority: str, cost: float) -> Ticket:
+        with self._cond:
+            ticket = self._enqueue(priority, cost)
+            if ticket.started_at is None:
+                ticket.waiter = asyncio.get_running_loop().create_future()
+
+        if ticket.waiter is not None:
+            try:
+                await asyncio.wait_for(ticket.waiter, timeout=self.classes[priority].deadline)
+            except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+                if ticket.started_at is not None:
+                    # Granted just as the caller gave up; hand the slot on
+                    self.release(ticket, observe=False)
+                else:
+                    with self._cond:
+                        self._abandon(ticket)
+                if isinstance(e, asyncio.TimeoutError):
+                    with self._cond:
+                        raise self._reject(priority, "timeout", 503, "Timed out waiting for a generation slot")
+                raise
+
+        self.metrics.ADMISSION_WAIT.labels(priority).observe(ticket.started_at - ticket.enqueued_at)
+        return ticket
+
+    @asynccontextmanager
+    async def slot(self, priority: str, cost: float):
+        """Hold a slot for the duration of an async with block"""
+        ticket = await self.acquire(priority, cost)
+        observe = False
+        try:
+            yield ticket
+            observe = True
+        finally:
+            self.release(ticket, observe)
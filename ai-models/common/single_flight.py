@@ -0,0 +1,106 @@
+import asyncio
+import copy
+import threading
+from concurrent.futures import Future
+from typing import Any, Awaitable, Callable, Dict, Tuple
+
+
+class SingleFlight:
+    """Deduplicate concurrent calls that share a key.
+
+    The first caller for a key runs the computation; callers arriving while
+    it is in flight wait for it and share its result (or exception) instead
+    of starting their own. Each caller gets its own deep copy of the result
+    so callers can annotate it freely. Nothing is kept once the call
+    finishes, so this is not a cache.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[str, Future] = {}
+        self._stats = {"calls": 0, "coalesced": 0}
+
+    def do(self, key: str, compute: Callable[[], Any]) -> Tuple[Any, bool]:
+        """Return (result, shared), where shared is True if another caller computed it"""
+        with self._lock:
+            self._stats["calls"] += 1
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._calls[key] = future
+            else:
+                self._stats["coalesced"] += 1
+
+        if leader:
+            try:
+                future.set_result(compute())
+            except BaseException as e:
+                future.set_exception(e)
+            finally:
+                with self._lock:
+                    del self._calls[key]
+
+        return copy.deepcopy(future.result()), not leader
+
+    def stats(self) -> Dict:
+        with self._lock:
+            calls = self._stats["calls"]
+            return {
+                "in_flight": len(self._calls),
+                "calls": calls,
+                "coalesced": self._stats["coalesced"],
+                "coalesced_ratio": self._stats["coalesced"] / calls if calls else 0.0
+            }
+
+
+class AsyncSingleFlight:
+    """asyncio counterpart of SingleFlight.
+
+    The computation runs as its own task so one caller disconnecting does
+    not cancel it for the others; it is cancelled only once every caller
+    waiting on it has gone away.
+    """
+
+    def __init__(self):
+        self._calls: Dict[str, list] = {}  # key -> [task, waiting callers]
+        self._stats = {"calls": 0, "coalesced": 0}
+
+    async def do(self, key: str, compute: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """Return (result, shared), where shared is True if another caller computed it"""
+        self._stats["calls"] += 1
+        call = self._calls.get(key)
+        leader = call is None
+        if leader:
+            call = [asyncio.ensure_future(compute()), 0]
+            self._calls[key] = call
+            call[0].add_done_callback(lambda task: self._forget(key, call))
+        else:
+            self._stats["coalesced"] += 1
+
+        call[1] += 1
+        try:
+            result = await asyncio.shield(call[0])
+        except asyncio.CancelledError:
+            if not call[0].done():
+                call[1] -= 1
+                if call[1] == 0:
+                    # Nobody is left to receive the result; stop it and let the next caller start afresh
+                    self._forget(key, call)
+                    call[0].cancel()
+            raise
+
+        return copy.deepcopy(result), not leader
+
+    def _forget(self, key: str, call: list):
+        if self._calls.get(key) is call:
+            del self._calls[key]
+
+    def stats(self) -> Dict:
+        calls = self._stats["calls"]
+        return {
+            "in_flight": len(self._calls),
+            "calls": calls,
+            "coalesced": self._stats["coalesced"],
+            "coalesced_ratio": self._stats["coalesced"] / calls if calls else 0.0
+        }
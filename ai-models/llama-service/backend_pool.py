@@ -0,0 +1,207 @@
+import logging
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Sequence
+
+
+class NoBackendAvailable(RuntimeError):
+    """Every Ollama backend is excluded or has its circuit breaker open"""
+
+
+class Backend:
+    """One Ollama node with its load, health and circuit breaker state"""
+
+    def __init__(self, url: str):
+        self.url = url.rstrip("/")
+        self.outstanding = 0
+        # Last /api/tags probe result; assumed healthy until the first probe says otherwise
+        self.healthy = True
+        self.models: List[Dict] = []
+        # time.monotonic() of the last probe; 0 until the first one
+        self.probed_at = 0.0
+        self.probing = False
+        # Circuit breaker: closed -> open after repeated failures -> half_open trial after a cooldown
+        self.state = "closed"
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.requests = 0
+        self.failures = 0
+
+    def serves(self, model: Optional[str]) -> bool:
+        """Whether the node has the model pulled; unknown until its first successful probe"""
+        if model is None or not self.models:
+            return True
+        names = {m.get("name") for m in self.models}
+        return model in names or f"{model}:latest" in names
+
+
+class BackendPool:
+    """Route Ollama calls across several nodes.
+
+    acquire() picks the node with the fewest outstanding requests among
+    those that serve the requested model, preferring nodes whose last health
+    probe succeeded and skipping nodes whose circuit breaker is open. A
+    breaker opens after failure_threshold consecutive failures; after
+    cooldown seconds the node gets a single trial request, and its outcome
+    closes or reopens the breaker.
+    """
+
+    def __init__(self, urls: Sequence[str], failure_threshold: int = 3, cooldown: float = 30.0):
+        self.backends = [Backend(url) for url in urls]
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self._lock = threading.Lock()
+        self._rotation = 0
+        self._probe_thread = None
+        self.probe_interval = 10.0
+        # Held while a request refreshes stale nodes, so concurrent requests do not probe them again
+        self._refresh_lock = threading.Lock()
+
+    def available(self, backend: Backend, now: float) -> bool:
+        if backend.state == "open":
+            return now - backend.opened_at >= self.cooldown
+        if backend.state == "half_open":
+            # Only one trial request at a time while the breaker is half open
+            return backend.outstanding == 0
+        return True
+
+    def acquire(self, model: str = None, exclude: Sequence[Backend] = ()) -> Backend:
+        """Reserve the least loaded usable node; pair every call with release()"""
+        with self._lock:
+            now = time.monotonic()
+            candidates = [b for b in self.backends if b not in exclude and self.available(b, now)]
+            # Nodes known to lack the model are used only if nothing else is left
+            candidates = [b for b in candidates if b.serves(model)] or candidates
+            if not candidates:
+                raise NoBackendAvailable("No Ollama backend is available")
+
+            # Rotate the starting point so ties do not always land on the first node
+            count = len(self.backends)
+            rotation = self._rotation
+            self._rotation = (rotation + 1) % count
+            backend = min(candidates, key=lambda b: (
+                not b.healthy,
+                b.outstanding,
+                (self.backends.index(b) - rotation) % count
+            ))
+
+            if backend.state == "open":
+                backend.state = "half_open"
+            backend.outstanding += 1
+            backend.requests += 1
+            return backend
+
+    def release(self, backend: Backend, ok: bool):
+        """Return a node reserved by acquire() and record whether the call succeeded"""
+        with self._lock:
+            backend.outstanding -= 1
+            if ok:
+                if backend.state != "closed":
+                    logging.info(f"Ollama backend {backend.url} recovered, closing its circuit breaker")
+                backend.state = "closed"
+                backend.consecutive_failures = 0
+                return
+
+            backend.failures += 1
+            backend.consecutive_failures += 1
+            if backend.state == "half_open" or (
+                backend.state == "closed" and backend.consecutive_failures >= self.failure_threshold
+            ):
+                logging.warning(f"Opening circuit breaker for Ollama backend {backend.url} "
+                                f"after {backend.consecutive_failures} consecutive failures")
+                backend.state = "open"
+                backend.opened_at = time.monotonic()
+
+    def probe_all(self, fetch_tags: Callable[[str], List[Dict]], backends: Sequence[Backend] = None):
+        """Refresh the health and model list of the given nodes, default all, concurrently
+
+        fetch_tags(url) returns the node's /api/tags models or raises; a hung
+        node delays the call by one probe timeout, not one per node.
+        """
+        def probe(backend: Backend):
+            backend.probing = True
+            try:
+                self.record_probe(backend, fetch_tags(backend.url))
+            except Exception as e:
+                self.record_probe(backend, None, e)
+            finally:
+                backend.probing = False
+
+        threads = [
+            threading.Thread(target=probe, args=(backend,), name="ollama-probe", daemon=True)
+            for backend in (self.backends if backends is None else backends)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    def stale(self) -> List[Backend]:
+        """Nodes not probed for two probe intervals, i.e. that the background checker has fallen behind on
+
+        A node with a probe in flight is not stale; waiting on it again would only duplicate that probe.
+        """
+        now = time.monotonic()
+        return [
+            backend for backend in self.backends
+            if not backend.probing and now - backend.probed_at > 2 * self.probe_interval
+        ]
+
+    def refresh_stale(self, fetch_tags: Callable[[str], List[Dict]]):
+        """Probe only stale nodes; requests arriving while a refresh runs use the cached state"""
+        stale = self.stale()
+        if stale and self._refresh_lock.acquire(blocking=False):
+            try:
+                self.probe_all(fetch_tags, stale)
+            finally:
+                self._refresh_lock.release()
+
+    def record_probe(self, backend: Backend, models: Optional[List[Dict]], error: Exception = None):
+        """Store one probe result: the node's /api/tags models, or None and the error"""
+        backend.probed_at = time.monotonic()
+        if models is None:
+            if backend.healthy:
+                logging.warning(f"Ollama backend {backend.url} failed its health probe: {error}")
+            backend.healthy = False
+            return
+
+        if not backend.healthy:
+            logging.info(f"Ollama backend {backend.url} passed its health probe again")
+        backend.healthy = True
+        backend.models = models
+
+    def start_probing(self, fetch_tags: Callable[[str], List[Dict]], interval: float):
+        """Probe all nodes every interval seconds from a daemon thread"""
+        self.probe_interval = interval
+
+        def run():
+            while True:
+                time.sleep(interval)
+                self.probe_all(fetch_tags)
+
+        if self._probe_thread is None:
+            self._probe_thread = threading.Thread(target=run, name="ollama-health-probe", daemon=True)
+            self._probe_thread.start()
+
+    def models(self) -> List[Dict]:
+        """Models served by healthy nodes, each listed once"""
+        seen = {}
+        for backend in self.backends:
+            if backend.healthy:
+                for model in backend.models:
+                    seen.setdefault(model.get("name"), model)
+        return list(seen.values())
+
+    def stats(self) -> List[Dict]:
+        with self._lock:
+            now = time.monotonic()
+            return [{
+                "url": backend.url,
+                "healthy": backend.healthy,
+                "circuit": backend.state,
+                "outstanding": backend.outstanding,
+                "requests": backend.requests,
+                "failures": backend.failures,
+                "probed_seconds_ago": round(now - backend.probed_at, 1) if backend.probed_at else None,
+                "models": [m.get("name") for m in backend.models]
+            } for backend in self.backends]
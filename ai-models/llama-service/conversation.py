@@ -0,0 +1,62 @@
+from typing import Dict, List
+
+# Rough characters per token for Llama-family tokenizers on English text
+CHARS_PER_TOKEN = 4
+# Role markers and separators each message adds to the prompt
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+def estimate_tokens(message: Dict) -> int:
+    """Approximate prompt tokens for one message without loading a tokenizer"""
+    return len(message.get("content", "")) // CHARS_PER_TOKEN + MESSAGE_OVERHEAD_TOKENS
+
+
+def summarize_turns(turns: List[Dict], max_tokens: int) -> Dict:
+    """A short, deterministic recap of dropped turns built from the user's questions"""
+    questions = []
+    budget = max_tokens * CHARS_PER_TOKEN
+    for turn in turns:
+        if turn["role"] != "user":
+            continue
+        question = " ".join(turn.get("content", "").split())
+        if len(question) > 120:
+            question = question[:117] + "..."
+        if sum(len(q) + 2 for q in questions) + len(question) > budget:
+            break
+        questions.append(question)
+
+    recap = f"{len(turns)} earlier messages were omitted."
+    if questions:
+        recap += " Earlier in this conversation the user asked: " + "; ".join(questions)
+    return {"role": "system", "content": recap}
+
+
+def compact_messages(messages: List[Dict], budget_tokens: int, step: int = 8, summary_tokens: int = 128) -> List[Dict]:
+    """Fit a conversation into budget_tokens, keeping the system prompt and the newest turns.
+
+    System messages are moved to the front as a stable prefix. When the
+    user/assistant turns do not fit, the oldest are replaced by a one-message
+    recap. The cut point only moves in multiples of step messages, so the
+    compacted prompt keeps the same prefix for several turns in a row and
+    Ollama can reuse its cached evaluation of it; a cut that moved every turn
+    would force a full re-evaluation each time. The newest turn is always
+    kept.
+    """
+    system = [{"role": "system", "content": m.get("content", "")} for m in messages if m.get("role") == "system"]
+    turns = [
+        {"role": m.get("role", "user"), "content": m.get("content", "")}
+        for m in messages if m.get("role", "user") in ("user", "assistant")
+    ]
+
+    available = budget_tokens - sum(estimate_tokens(m) for m in system)
+    costs = [estimate_tokens(m) for m in turns]
+    if sum(costs) <= available:
+        return system + turns
+
+    available -= summary_tokens + MESSAGE_OVERHEAD_TOKENS
+    cut = step
+    while cut < len(turns) - 1 and sum(costs[cut:]) > available:
+        cut += step
+    cut = min(cut, len(turns) - 1)
+
+    return system + [summarize_turns(turns[:cut], summary_tokens)] + turns[cut:]
@@ -0,0 +1,493 @@
+import asyncio
+import json
+import logging
+import os
+import sys
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, List, Optional
+
+import aiohttp
+from aiohttp import web
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+
+from llama_service import (
+    LlamaService,
+    OllamaStatusError,
+    llama_service,
+    format_chat_completion,
+    format_chat_completion_chunk,
+    format_model_list,
+    pool_health
+)
+# Entry point of the asyncio mode, so it puts ai-models/ on the path itself rather than rely on import order
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.admission import INTERACTIVE, AsyncAdmissionController, Overloaded
+from common.single_flight import AsyncSingleFlight
+import metrics as service_metrics
+from metrics import COALESCED_REQUESTS, ERRORS, OLLAMA_ERRORS, REQUEST_LATENCY, REQUESTS_IN_FLIGHT, observe_ollama_chunk, observe_ollama_result
+
+
+class AsyncLlamaServer:
+    """asyncio serving mode for LlamaService.
+
+    Keeps the Flask routes and JSON shapes, but talks to Ollama through an
+    aiohttp client so an idle connection costs a coroutine instead of a
+    thread. Generations are admitted through the same interactive and batch
+    queues as the Flask service, with the same caps, weights and deadlines.
+    When a client disconnects its handler is cancelled, which closes the
+    upstream request and stops Ollama generating.
+    """
+
+    def __init__(self, service: LlamaService):
+        self.service = service
+        self.admission = AsyncAdmissionController(service.max_concurrent, service.queue_classes, service.seconds_per_token, service_metrics)
+        self.session = None
+        self.cancelled = 0
+        self.single_flight = AsyncSingleFlight() if service.single_flight is not None else None
+
+    async def on_startup(self, app: web.Application):
+        self.session = aiohttp.ClientSession(
+            # pool_size is per node, the connector limit is across all of them
+            connector=aiohttp.TCPConnector(
+                limit=self.service.pool_size * len(self.service.backend_pool.backends),
+                limit_per_host=self.service.pool_size,
+                keepalive_timeout=60
+            ),
+            timeout=aiohttp.ClientTimeout(
+                sock_connect=self.service.connect_timeout,
+                sock_read=self.service.read_timeout
+            )
+        )
+
+    async def on_cleanup(self, app: web.Application):
+        await self.session.close()
+
+    @asynccontextmanager
+    async def generation_slot(self, priority: str, cost: int):
+        """Hold an admission slot for a generation, counting clients that disconnect during it"""
+        async with self.admission.slot(priority, cost):
+            try:
+                yield
+            except asyncio.CancelledError:
+                self.cancelled += 1
+                logging.info("Client disconnected, cancelled upstream generation")
+                raise
+
+    def concurrency_stats(self) -> Dict:
+        return {**self.admission.stats(), "cancelled": self.cancelled}
+
+    def should_retry(self, error: Exception, tried: List, yielded: bool = False) -> bool:
+        """Retry on another node only if the request never reached this one"""
+        return (
+            not yielded
+            and isinstance(error, aiohttp.ClientConnectorError)
+            and len(tried) < self.service.max_attempts
+        )
+
+    async def ollama_post(self, path: str, payload: Dict) -> Dict:
+        """POST to the least loaded Ollama node and return the decoded JSON body, raising on a non-200 status"""
+        pool = self.service.backend_pool
+        tried = []
+        while True:
+            backend = pool.acquire(payload.get("model"), exclude=tried)
+            tried.append(backend)
+            ok = False
+            try:
+                async with self.session.post(f"{backend.url}{path}", json=payload) as response:
+                    ok = response.status < 500
+                    if response.status != 200:
+                        OLLAMA_ERRORS.labels(f"http_{response.status}").inc()
+                        if not ok and len(tried) < self.service.max_attempts:
+                            logging.warning(f"Ollama backend {backend.url} returned {response.status}, retrying on another node")
+                            continue
+                        raise OllamaStatusError(response.status, await response.text())
+                    result = await response.json()
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                ok = False
+                OLLAMA_ERRORS.labels(type(e).__name__).inc()
+                if self.should_retry(e, tried):
+                    logging.warning(f"Ollama backend {backend.url} failed ({e}), retrying on another node")
+                    continue
+                raise
+            except asyncio.CancelledError:
+                # The client went away, which says nothing about the node
+                ok = True
+                raise
+            finally:
+                pool.release(backend, ok)
+
+            observe_ollama_result(result)
+            return result
+
+    async def stream_ollama(self, path: str, payload: Dict) -> AsyncIterator[Dict]:
+        """POST a streaming request to the least loaded node and yield each NDJSON chunk as it arrives"""
+        pool = self.service.backend_pool
+        tried = []
+        while True:
+            backend = pool.acquire(payload.get("model"), exclude=tried)
+            tried.append(backend)
+            ok = False
+            retry = False
+            yielded = False
+            try:
+                async with self.session.post(f"{backend.url}{path}", json=payload) as response:
+                    if response.status != 200:
+                        OLLAMA_ERRORS.labels(f"http_{response.status}").inc()
+                        ok = response.status < 500
+                        retry = not ok and len(tried) < self.service.max_attempts
+                        if not retry:
+                            raise OllamaStatusError(response.status, await response.text())
+                    else:
+                        async for line in response.content:
+                            if line.strip():
+                                chunk = json.loads(line)
+                                observe_ollama_chunk(chunk)
+                                yielded = True
+                                yield chunk
+                        ok = True
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                OLLAMA_ERRORS.labels(type(e).__name__).inc()
+                retry = self.should_retry(e, tried, yielded)
+                if not retry:
+                    raise
+            except (asyncio.CancelledError, GeneratorExit):
+                ok = True
+                raise
+            finally:
+                pool.release(backend, ok)
+
+            if not retry:
+                return
+            logging.warning(f"Ollama backend {backend.url} failed, retrying the stream on another node")
+
+    async def fetch_tags(self, backend):
+        """Probe one node's /api/tags and record the result in the pool"""
+        backend.probing = True
+        try:
+            async with self.session.get(f"{backend.url}/api/tags", timeout=aiohttp.ClientTimeout(total=5)) as response:
+                if response.status != 200:
+                    raise OllamaStatusError(response.status, await response.text())
+                models = (await response.json()).get('models', [])
+        except Exception as e:
+            self.service.backend_pool.record_probe(backend, None, e)
+            return
+        finally:
+            backend.probing = False
+        self.service.backend_pool.record_probe(backend, models)
+
+    async def probe_backends(self):
+        """Probe, concurrently, only the nodes whose background probes have fallen behind"""
+        await asyncio.gather(*(self.fetch_tags(backend) for backend in self.service.backend_pool.stale()))
+
+    async def coalesce(self, operation: str, payload: Dict, priority: str, fetch) -> Dict:
+        """Await fetch(), or join an identical request of the same priority that is already awaiting it"""
+        if self.single_flight is None:
+            return await fetch()
+
+        output, shared = await self.single_flight.do(self.service.request_key(operation, payload, priority), fetch)
+        if shared:
+            COALESCED_REQUESTS.labels(operation).inc()
+        return output
+
+    async def post_chat(self, payload: Dict) -> Dict:
+        """Async counterpart of LlamaService.post_chat"""
+        use_chat_api = self.service.chat_api
+        try:
+            return await self.ollama_post(*self.service.chat_request(payload, use_chat_api))
+        except OllamaStatusError as e:
+            if e.status_code != 404 or not use_chat_api:
+                raise
+        result = await self.ollama_post(*self.service.chat_request(payload, use_chat_api=False))
+        self.service.disable_chat_api()
+        return result
+
+    async def stream_chat(self, payload: Dict) -> AsyncIterator[Dict]:
+        """Async counterpart of LlamaService.stream_chat"""
+        use_chat_api = self.service.chat_api
+        try:
+            async for chunk in self.stream_ollama(*self.service.chat_request(payload, use_chat_api)):
+                yield chunk
+            return
+        except OllamaStatusError as e:
+            # A missing endpoint fails before any chunk has been yielded
+            if e.status_code != 404 or not use_chat_api:
+                raise
+        async for chunk in self.stream_ollama(*self.service.chat_request(payload, use_chat_api=False)):
+            yield chunk
+        self.service.disable_chat_api()
+
+    async def generate_response(self, prompt: str, max_tokens: int, temperature: float, use_cache: bool,
+                                priority: str = INTERACTIVE) -> Dict:
+        """Async counterpart of LlamaService.generate_response"""
+        payload = self.service.build_generate_payload(prompt, max_tokens, temperature)
+
+        cache_key = self.service.completion_cache_key(payload, use_cache)
+        if cache_key is not None:
+            cached = self.service.cache.get(cache_key)
+            if cached is not None:
+                cached["cached"] = True
+                return cached
+
+        try:
+            return await self.coalesce(
+                "generate", payload, priority, lambda: self.fetch(payload, cache_key, priority, chat=False)
+            )
+        except asyncio.TimeoutError:
+            return {
+                "success": False,
+                "error": "Request timeout - model took too long to respond"
+            }
+        except (aiohttp.ClientError, RuntimeError) as e:
+            return {
+                "success": False,
+                "error": f"Error calling Ollama API: {str(e)}"
+            }
+
+    async def chat_completion(self, messages, max_tokens: int, temperature: float, use_cache: bool,
+                              priority: str = INTERACTIVE) -> Dict:
+        """Async counterpart of LlamaService.chat_completion"""
+        payload = self.service.build_chat_payload(messages, max_tokens, temperature)
+
+        cache_key = self.service.completion_cache_key(payload, use_cache)
+        if cache_key is not None:
+            cached = self.service.cache.get(cache_key)
+            if cached is not None:
+                cached["created"] = int(time.time())
+                cached["cached"] = True
+                return cached
+
+        try:
+            return await self.coalesce(
+                "chat", payload, priority, lambda: self.fetch(payload, cache_key, priority, chat=True)
+            )
+        except (aiohttp.ClientError, asyncio.TimeoutError, RuntimeError) as e:
+            return {
+                "success": False,
+                "error": f"Chat completion error: {str(e)}"
+            }
+
+    async def fetch(self, payload: Dict, cache_key: Optional[str], priority: str, chat: bool) -> Dict:
+        """Call Ollama in a generation slot and shape, and possibly cache, its result"""
+        async with self.generation_slot(priority, self.service.request_cost(payload)):
+            if chat:
+                result = await self.post_chat(payload)
+            else:
+                result = await self.ollama_post("/api/generate", payload)
+
+        output = self.service.format_chat_result(result) if chat else self.service.format_generate_result(result)
+        if cache_key is not None:
+            self.service.cache.put(cache_key, output)
+        return output
+
+    async def health_check(self, request: web.Request) -> web.Response:
+        try:
+            await self.probe_backends()
+            backends = self.service.backend_pool.stats()
+            status = pool_health(backends)
+
+            return web.json_response({
+                "status": status,
+                "ollama_connected": status != "unhealthy",
+                "model": self.service.model_name,
+                "backends": backends,
+                "admission": self.concurrency_stats(),
+                "coalescing": self.single_flight.stats() if self.single_flight is not None else None,
+                "cache": self.service.cache.stats() if self.service.cache is not None else None,
+                "timestamp": int(time.time())
+            })
+        except Exception as e:
+            return web.json_response({
+                "status": "unhealthy",
+                "ollama_connected": False,
+                "error": str(e),
+                "timestamp": int(time.time())
+            })
+
+    async def generate(self, request: web.Request) -> web.StreamResponse:
+        """Generate text completion"""
+        try:
+            data = await request.json()
+
+            if not data or 'prompt' not in data:
+                return web.json_response({"error": "Missing required field: prompt"}, status=400)
+
+            prompt = data['prompt']
+            temperature = data.get('temperature', 0.7)
+            try:
+                max_tokens = self.service.request_max_tokens(data)
+            except ValueError as e:
+                return web.json_response({"error": str(e)}, status=400)
+
+            if not prompt.strip():
+                return web.json_response({"error": "Prompt cannot be empty"}, status=400)
+
+            if max_tokens > 4096:
+                return web.json_response({"error": "max_tokens cannot exceed 4096"}, status=400)
+
+            try:
+                priority = self.service.request_priority(data, max_tokens)
+            except ValueError as e:
+                return web.json_response({"error": str(e)}, status=400)
+
+            if data.get('stream', False):
+                payload = self.service.build_generate_payload(prompt, max_tokens, temperature, stream=True)
+                return await self.stream_events(
+                    request, payload, priority,
+                    self.stream_ollama("/api/generate", payload), self.service.generate_stream_events,
+                    "application/x-ndjson",
+                    lambda event: json.dumps(event) + "\n"
+                )
+
+            result = await self.generate_response(prompt, max_tokens, temperature, data.get('cache', False), priority)
+            return web.json_response(result, status=200 if result["success"] else 500)
+
+        except Overloaded as e:
+            return self.overloaded_response(e)
+        except Exception as e:
+            logging.error(f"Error in generate endpoint: {e}")
+            return web.json_response({"error": "Internal server error", "details": str(e)}, status=500)
+
+    async def chat_completions(self, request: web.Request) -> web.StreamResponse:
+        """OpenAI-compatible chat completions endpoint"""
+        try:
+            data = await request.json()
+
+            if not data or 'messages' not in data:
+                return web.json_response({"error": "Missing required field: messages"}, status=400)
+
+            messages = data['messages']
+            temperature = data.get('temperature', 0.7)
+            try:
+                max_tokens = self.service.request_max_tokens(data)
+            except ValueError as e:
+                return web.json_response({"error": str(e)}, status=400)
+
+            if not isinstance(messages, list) or len(messages) == 0:
+                return web.json_response({"error": "messages must be a non-empty list"}, status=400)
+
+            try:
+                priority = self.service.request_priority(data, max_tokens)
+            except ValueError as e:
+                return web.json_response({"error": str(e)}, status=400)
+
+            if data.get('stream', False):
+                created = int(time.time())
+                chunk_id = f"chatcmpl-{created}"
+                model = self.service.model_name
+                payload = self.service.build_chat_payload(messages, max_tokens, temperature, stream=True)
+                return await self.stream_events(
+                    request, payload, priority,
+                    self.stream_chat(payload), self.service.chat_stream_events, "text/event-stream",
+                    lambda event: format_chat_completion_chunk(event, chunk_id, created, model),
+                    prologue=format_chat_completion_chunk({"role": "assistant"}, chunk_id, created, model),
+                    epilogue="data: [DONE]\n\n"
+                )
+
+            result = await self.chat_completion(messages, max_tokens, temperature, data.get('cache', False), priority)
+
+            if result["success"]:
+                return web.json_response(format_chat_completion(result))
+            else:
+                return web.json_response(result, status=500)
+
+        except Overloaded as e:
+            return self.overloaded_response(e)
+        except Exception as e:
+            logging.error(f"Error in chat completions endpoint: {e}")
+            return web.json_response({"error": "Internal server error", "details": str(e)}, status=500)
+
+    async def stream_events(self, request: web.Request, payload: Dict, priority: str, chunks: AsyncIterator[Dict],
+                            to_events, content_type: str, encode, prologue: str = None,
+                            epilogue: str = None) -> web.StreamResponse:
+        """Hold a generation slot for payload while relaying Ollama's chunks to the client"""
+        async with self.generation_slot(priority, self.service.request_cost(payload)):
+            response = web.StreamResponse(headers={
+                "Content-Type": content_type,
+                "Cache-Control": "no-cache",
+                "X-Accel-Buffering": "no"
+            })
+            await response.prepare(request)
+
+            if prologue:
+                await response.write(prologue.encode("utf-8"))
+
+            try:
+                async for chunk in chunks:
+                    for event in to_events(chunk):
+                        await response.write(encode(event).encode("utf-8"))
+                    if chunk.get("error"):
+                        break
+            except (aiohttp.ClientError, asyncio.TimeoutError, RuntimeError) as e:
+                error = {"success": False, "error": f"Error calling Ollama API: {str(e)}"}
+                await response.write(encode(error).encode("utf-8"))
+
+            if epilogue:
+                await response.write(epilogue.encode("utf-8"))
+            await response.write_eof()
+            return response
+
+    async def list_models(self, request: web.Request) -> web.Response:
+        """List models available across the Ollama nodes"""
+        try:
+            await self.probe_backends()
+            pool = self.service.backend_pool
+            if not any(backend.healthy for backend in pool.backends):
+                return web.json_response({"error": "Could not fetch models from Ollama"}, status=500)
+
+            # Format to match OpenAI API structure
+            return web.json_response(format_model_list(pool.models()))
+
+        except Exception as e:
+            return web.json_response({"error": f"Error listing models: {str(e)}"}, status=500)
+
+    @web.middleware
+    async def metrics_middleware(self, request: web.Request, handler) -> web.StreamResponse:
+        """Track latency, in-flight requests and errors per handler, streaming included"""
+        endpoint = getattr(request.match_info.handler, "__name__", "unknown")
+        if endpoint == "metrics":
+            return await handler(request)
+
+        started = time.perf_counter()
+        REQUESTS_IN_FLIGHT.labels(endpoint).inc()
+        try:
+            response = await handler(request)
+        except asyncio.CancelledError:
+            ERRORS.labels(endpoint, "client_disconnected").inc()
+            raise
+        except web.HTTPException as e:
+            ERRORS.labels(endpoint, f"http_{e.status}").inc()
+            raise
+        finally:
+            REQUESTS_IN_FLIGHT.labels(endpoint).dec()
+            REQUEST_LATENCY.labels(endpoint).observe(time.perf_counter() - started)
+
+        if response.status >= 400:
+            ERRORS.labels(endpoint, f"http_{response.status}").inc()
+        return response
+
+    async def metrics(self, request: web.Request) -> web.Response:
+        """Prometheus metrics"""
+        return web.Response(body=generate_latest(), headers={"Content-Type": CONTENT_TYPE_LATEST})
+
+    @staticmethod
+    def overloaded_response(error: Overloaded) -> web.Response:
+        return web.json_response({"error": error.message}, status=error.status,
+                                 headers={"Retry-After": str(error.retry_after)})
+
+    def create_app(self) -> web.Application:
+        app = web.Application(middlewares=[self.metrics_middleware])
+        app.on_startup.append(self.on_startup)
+        app.on_cleanup.append(self.on_cleanup)
+        app.router.add_get('/health', self.health_check)
+        app.router.add_post('/generate', self.generate)
+        app.router.add_post('/chat/completions', self.chat_completions)
+        app.router.add_get('/models', self.list_models)
+        app.router.add_get('/metrics', self.metrics)
+        return app
+
+
+if __name__ == '__main__':
+    server = AsyncLlamaServer(llama_service)
+    # handler_cancellation cancels the handler, and with it the upstream call, when the client goes away
+    web.run_app(server.create_app(), host='0.0.0.0', port=8002, handler_cancellation=True)
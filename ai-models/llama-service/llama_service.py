@@ -1,76 +1,474 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, g, request, jsonify, stream_with_context
 import requests
+from requests.adapters import HTTPAdapter
+import hashlib
 import json
 import logging
-from typing import Dict, List, Optional
+import os
+import sys
+from typing import Dict, Iterator, List, Optional, Tuple
 import time
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+# Run as a script from llama-service/; the common package it shares with question-generator is in ai-models/
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.admission import BATCH, INTERACTIVE, PRIORITIES, AdmissionController, Overloaded, queue_classes_from_env
+from common.single_flight import SingleFlight
+import metrics as service_metrics
+from backend_pool import BackendPool
+from completion_cache import CompletionCache
+from conversation import compact_messages
+from metrics import COALESCED_REQUESTS, ERRORS, OLLAMA_ERRORS, REQUEST_LATENCY, REQUESTS_IN_FLIGHT, observe_ollama_chunk, observe_ollama_result
 
 app = Flask(__name__)
 logging.basicConfig(level=logging.INFO)
 
+class OllamaStatusError(RuntimeError):
+    """Ollama answered a request with a non-200 status"""
+    
+    def __init__(self, status_code: int, text: str):
+        super().__init__(f"Ollama API returned status {status_code}: {text}")
+        self.status_code = status_code
+
+def chat_content(result: Dict) -> str:
+    """Generated text of an /api/chat response or chunk, or of the /api/generate fallback"""
+    if "message" in result:
+        return result["message"].get("content", "")
+    return result.get("response", "")
+
 class LlamaService:
     def __init__(self):
-        self.ollama_url = "http://localhost:11434"  # Default Ollama URL
+        # Comma-separated OLLAMA_URLS spreads generation over several nodes; OLLAMA_URL is the single-node default
+        urls = [url.strip() for url in os.environ.get("OLLAMA_URLS", "").split(",") if url.strip()]
+        self.backend_pool = BackendPool(
+            urls or [os.environ.get("OLLAMA_URL", "http://localhost:11434")],
+            failure_threshold=int(os.environ.get("OLLAMA_FAILURE_THRESHOLD", 3)),
+            cooldown=float(os.environ.get("OLLAMA_BREAKER_COOLDOWN", 30))
+        )
+        self.ollama_url = self.backend_pool.backends[0].url
+        # Nodes tried per call when one refuses the connection or answers with a 5xx
+        self.max_attempts = min(int(os.environ.get("OLLAMA_MAX_ATTEMPTS", 2)), len(self.backend_pool.backends))
         self.model_name = "llama3.1"  # Your locally downloaded model
         self.max_tokens = 2048
         self.temperature = 0.7
+        # Separate connect and read timeouts for calls to Ollama
+        self.connect_timeout = float(os.environ.get("OLLAMA_CONNECT_TIMEOUT", 3.05))
+        self.read_timeout = float(os.environ.get("OLLAMA_READ_TIMEOUT", 120))  # 2 minute timeout
+        # Interactive and batch requests queue separately for a bounded number of concurrent generations
+        self.max_concurrent = int(os.environ.get("LLAMA_MAX_CONCURRENT", 4 * len(self.backend_pool.backends)))
+        # Connections per node; never fewer than the admitted generations (all of which may land on one node)
+        # plus room for health probes, so a blocking pool cannot stall a request that already holds a slot
+        self.pool_size = max(int(os.environ.get("OLLAMA_POOL_SIZE", 32)), self.max_concurrent + 2)
+        self.session = self.create_session()
+        # Completion cache; only consulted for temperature 0 or when the caller opts in
+        cache_bytes = int(os.environ.get("LLAMA_CACHE_MAX_BYTES", 64 * 1024 * 1024))
+        self.cache = CompletionCache(
+            max_bytes=cache_bytes,
+            ttl_seconds=float(os.environ.get("LLAMA_CACHE_TTL", 3600))
+        ) if cache_bytes > 0 else None
+        # Identical non-streaming requests arriving while one is in flight share its Ollama call
+        self.single_flight = SingleFlight() if os.environ.get("LLAMA_COALESCE", "1") != "0" else None
+        # Chat history is compacted to this many prompt tokens, inside a num_ctx window
+        self.context_tokens = int(os.environ.get("LLAMA_NUM_CTX", 4096))
+        self.history_tokens = int(os.environ.get("LLAMA_HISTORY_TOKENS", 3072))
+        # Oldest turns are dropped this many messages at a time so the prompt prefix stays stable
+        self.compact_step = int(os.environ.get("LLAMA_COMPACT_STEP", 8))
+        # How long Ollama keeps the model, and its prompt cache, loaded between turns
+        self.keep_alive = os.environ.get("LLAMA_KEEP_ALIVE", "30m")
+        # Chat goes through /api/chat; switched off if this Ollama is too old to have it
+        self.chat_api = True
+        self.queue_classes = queue_classes_from_env(
+            "LLAMA", self.max_concurrent,
+            batch_limit=max(1, self.max_concurrent // 2),
+            interactive_queue=int(os.environ.get("LLAMA_MAX_QUEUE", 64)),
+            batch_queue=256,
+            interactive_deadline=float(os.environ.get("LLAMA_QUEUE_TIMEOUT", 30)),
+            batch_deadline=600
+        )
+        # Starting point for cost estimates; refined from the durations of finished requests
+        self.seconds_per_token = float(os.environ.get("LLAMA_SECONDS_PER_TOKEN", 0.05))
+        # Requests asking for more tokens than this run as batch unless they set a priority
+        self.interactive_max_tokens = int(os.environ.get("LLAMA_INTERACTIVE_MAX_TOKENS", 1024))
+        self.admission = AdmissionController(self.max_concurrent, self.queue_classes, self.seconds_per_token, service_metrics)
         self.check_model_availability()
+        self.backend_pool.start_probing(self.fetch_tags, float(os.environ.get("OLLAMA_PROBE_INTERVAL", 10)))
+    
+    def create_session(self) -> requests.Session:
+        """Create a keep-alive session with a bounded connection pool to Ollama"""
+        session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=len(self.backend_pool.backends),  # One connection pool per node
+            pool_maxsize=self.pool_size,
+            pool_block=True  # Never more sockets than pool_size; admission keeps callers below it
+        )
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        return session
+    
+    def ollama_get(self, path: str, read_timeout: float = None, base_url: str = None) -> requests.Response:
+        """GET an Ollama endpoint over the pooled session, on the first node unless base_url is given"""
+        return self.session.get(
+            f"{base_url or self.ollama_url}{path}",
+            timeout=(self.connect_timeout, read_timeout or self.read_timeout)
+        )
+    
+    def should_retry(self, error: Exception, tried: List, yielded: bool = False) -> bool:
+        """Retry on another node only if the request never reached this one"""
+        return (
+            not yielded
+            and isinstance(error, requests.exceptions.ConnectionError)
+            and len(tried) < self.max_attempts
+        )
+    
+    def ollama_post(self, path: str, payload: Dict, read_timeout: float = None) -> requests.Response:
+        """POST a JSON payload to the least loaded Ollama node, retrying another node if it fails"""
+        tried = []
+        while True:
+            backend = self.backend_pool.acquire(payload.get("model"), exclude=tried)
+            tried.append(backend)
+            try:
+                response = self.session.post(
+                    f"{backend.url}{path}",
+                    json=payload,
+                    timeout=(self.connect_timeout, read_timeout or self.read_timeout)
+                )
+            except requests.exceptions.RequestException as e:
+                self.backend_pool.release(backend, ok=False)
+                OLLAMA_ERRORS.labels(type(e).__name__).inc()
+                if self.should_retry(e, tried):
+                    logging.warning(f"Ollama backend {backend.url} failed ({e}), retrying on another node")
+                    continue
+                raise
+            
+            failed = response.status_code >= 500
+            self.backend_pool.release(backend, ok=not failed)
+            if response.status_code != 200:
+                OLLAMA_ERRORS.labels(f"http_{response.status_code}").inc()
+            if failed and len(tried) < self.max_attempts:
+                logging.warning(f"Ollama backend {backend.url} returned {response.status_code}, retrying on another node")
+                continue
+            return response
+    
+    def pool_stats(self) -> Dict:
+        """Report connection pool configuration and per-host usage"""
+        adapter = self.session.get_adapter(self.ollama_url)
+        hosts = []
+        for key in adapter.poolmanager.pools.keys():
+            pool = adapter.poolmanager.pools[key]
+            hosts.append({
+                "host": f"{pool.scheme}://{pool.host}:{pool.port}",
+                "connections_opened": pool.num_connections,
+                "requests_sent": pool.num_requests,
+                # The pool queue is pre-filled with None placeholders for unopened slots
+                "idle_connections": sum(1 for conn in list(pool.pool.queue) if conn is not None) if pool.pool is not None else 0
+            })
+        return {
+            "pool_size": self.pool_size,
+            "connect_timeout": self.connect_timeout,
+            "read_timeout": self.read_timeout,
+            "hosts": hosts
+        }
+    
+    def fetch_tags(self, url: str) -> List[Dict]:
+        """Return the models one Ollama node serves; raises if it is unreachable"""
+        response = self.ollama_get("/api/tags", read_timeout=5, base_url=url)
+        if response.status_code != 200:
+            raise OllamaStatusError(response.status_code, response.text)
+        return response.json().get('models', [])
     
     def check_model_availability(self):
-        """Check if Llama model is available in Ollama"""
-        try:
-            response = requests.get(f"{self.ollama_url}/api/tags")
-            if response.status_code == 200:
-                models = response.json().get('models', [])
-                model_names = [model['name'] for model in models]
-                if self.model_name not in model_names and f"{self.model_name}:latest" not in model_names:
-                    logging.warning(f"Model {self.model_name} not found. Available models: {model_names}")
-                else:
-                    logging.info(f"Model {self.model_name} is available")
+        """Check if Llama model is available on each Ollama node"""
+        self.backend_pool.probe_all(self.fetch_tags)
+        for backend in self.backend_pool.backends:
+            if not backend.healthy:
+                logging.error(f"Could not connect to Ollama service at {backend.url}")
+                continue
+            
+            model_names = [model['name'] for model in backend.models]
+            if self.model_name not in model_names and f"{self.model_name}:latest" not in model_names:
+                logging.warning(f"Model {self.model_name} not found on {backend.url}. Available models: {model_names}")
             else:
-                logging.error("Could not connect to Ollama service")
+                logging.info(f"Model {self.model_name} is available on {backend.url}")
+    
+    def build_generate_payload(self, prompt: str, max_tokens: int = None, temperature: float = None, stream: bool = False) -> Dict:
+        """Build the Ollama /api/generate payload for a raw prompt"""
+        return {
+            "model": self.model_name,
+            "prompt": prompt,
+            "stream": stream,
+            "options": {
+                "num_predict": max_tokens or self.max_tokens,
+                "temperature": temperature if temperature is not None else self.temperature,
+                "top_p": 0.9,
+                "top_k": 40
+            }
+        }
+    
+    def build_chat_payload(self, messages: List[Dict], max_tokens: int = None, temperature: float = None, stream: bool = False) -> Dict:
+        """Build the Ollama /api/chat payload for a conversation, compacted to the history budget"""
+        return {
+            "model": self.model_name,
+            "messages": compact_messages(messages, self.history_tokens, self.compact_step),
+            "stream": stream,
+            "keep_alive": self.keep_alive,
+            "options": {
+                "num_predict": max_tokens or self.max_tokens,
+                "num_ctx": self.context_tokens,
+                "temperature": temperature if temperature is not None else self.temperature,
+                "top_p": 0.9,
+                "top_k": 40,
+                "repeat_penalty": 1.1
+            }
+        }
+    
+    def chat_request(self, payload: Dict, use_chat_api: bool = True) -> Tuple[str, Dict]:
+        """Path and body for a chat payload, flattened for /api/generate unless use_chat_api"""
+        if use_chat_api:
+            return "/api/chat", payload
+        
+        body = {key: value for key, value in payload.items() if key != "messages"}
+        body["prompt"] = self.messages_to_prompt(payload["messages"])
+        return "/api/generate", body
+    
+    def request_max_tokens(self, data: Dict, default: int = 1000) -> int:
+        """The request's max_tokens field, with null treated as absent"""
+        max_tokens = data.get('max_tokens')
+        if max_tokens is None:
+            return default
+        if type(max_tokens) is not int or max_tokens < 1:
+            raise ValueError("max_tokens must be a positive integer")
+        return max_tokens
+    
+    def request_priority(self, data: Dict, max_tokens: int) -> str:
+        """The request's priority field, else batch for long completions and interactive otherwise"""
+        priority = data.get('priority')
+        if priority is None:
+            return BATCH if max_tokens > self.interactive_max_tokens else INTERACTIVE
+        if priority not in PRIORITIES:
+            raise ValueError(f"priority must be one of: {', '.join(PRIORITIES)}")
+        return priority
+    
+    @staticmethod
+    def request_cost(payload: Dict) -> int:
+        """Estimated cost of a payload for admission control, in tokens to generate"""
+        return payload["options"]["num_predict"]
+    
+    def disable_chat_api(self):
+        if self.chat_api:
+            logging.warning("Ollama has no /api/chat, falling back to /api/generate with a flattened prompt")
+            self.chat_api = False
+    
+    def completion_cache_key(self, payload: Dict, use_cache: bool = False) -> Optional[str]:
+        """Return the cache key for a payload, or None if it must not be served from cache"""
+        if self.cache is None:
+            return None
+        # Sampled output is only reusable when it is deterministic or the caller accepts a repeat
+        if payload["options"]["temperature"] != 0 and not use_cache:
+            return None
+        prompt = payload["prompt"] if "prompt" in payload else json.dumps(payload["messages"], sort_keys=True)
+        return self.cache.make_key(payload["model"], prompt, payload["options"])
+    
+    def format_generate_result(self, result: Dict) -> Dict:
+        """Shape a completed Ollama /api/generate response for /generate"""
+        return {
+            "success": True,
+            "generated_text": result.get("response", ""),
+            "done": result.get("done", False),
+            "total_duration": result.get("total_duration", 0),
+            "load_duration": result.get("load_duration", 0),
+            "prompt_eval_count": result.get("prompt_eval_count", 0),
+            "eval_count": result.get("eval_count", 0)
+        }
+    
+    def format_chat_result(self, result: Dict) -> Dict:
+        """Shape a completed Ollama response for /chat/completions"""
+        return {
+            "success": True,
+            "response": chat_content(result),
+            "done": result.get("done", False),
+            "model": self.model_name,
+            "created": int(time.time()),
+            "usage": {
+                "prompt_tokens": result.get("prompt_eval_count", 0),
+                "completion_tokens": result.get("eval_count", 0),
+                "total_tokens": result.get("prompt_eval_count", 0) + result.get("eval_count", 0)
+            }
+        }
+    
+    def generate_stream_events(self, chunk: Dict) -> List[Dict]:
+        """Translate one streamed Ollama chunk into /generate stream events"""
+        if chunk.get("error"):
+            return [{"success": False, "error": chunk["error"]}]
+        
+        if not chunk.get("done", False):
+            return [{"generated_text": chunk.get("response", ""), "done": False}]
+        
+        return [self.format_generate_result(chunk)]
+    
+    def chat_stream_events(self, chunk: Dict) -> List[Dict]:
+        """Translate one streamed Ollama chunk into chat content and usage events"""
+        if chunk.get("error"):
+            return [{"success": False, "error": chunk["error"]}]
+        
+        events = []
+        content = chat_content(chunk)
+        if content:
+            events.append({"content": content, "done": False})
+        
+        if chunk.get("done", False):
+            events.append({
+                "success": True,
+                "done": True,
+                "usage": self.format_chat_result(chunk)["usage"]
+            })
+        return events
+    
+    def stream_ollama(self, path: str, payload: Dict) -> Iterator[Dict]:
+        """POST a streaming request to the least loaded node and yield each NDJSON chunk as it arrives
+
+        A node that refuses the connection or answers with a 5xx is retried
+        on another node, as long as nothing has been yielded yet.
+        """
+        tried = []
+        while True:
+            backend = self.backend_pool.acquire(payload.get("model"), exclude=tried)
+            tried.append(backend)
+            ok = False
+            retry = False
+            yielded = False
+            try:
+                with self.session.post(
+                    f"{backend.url}{path}",
+                    json=payload,
+                    stream=True,
+                    timeout=(self.connect_timeout, self.read_timeout)
+                ) as response:
+                    if response.status_code != 200:
+                        OLLAMA_ERRORS.labels(f"http_{response.status_code}").inc()
+                        ok = response.status_code < 500
+                        retry = not ok and len(tried) < self.max_attempts
+                        if not retry:
+                            raise OllamaStatusError(response.status_code, response.text)
+                    else:
+                        for line in response.iter_lines():
+                            if line:
+                                chunk = json.loads(line)
+                                observe_ollama_chunk(chunk)
+                                yielded = True
+                                yield chunk
+                        ok = True
+            except requests.exceptions.RequestException as e:
+                OLLAMA_ERRORS.labels(type(e).__name__).inc()
+                retry = self.should_retry(e, tried, yielded)
+                if not retry:
+                    raise
+            except GeneratorExit:
+                # The caller stopped reading, which says nothing about the node
+                ok = True
+                raise
+            finally:
+                self.backend_pool.release(backend, ok)
+            
+            if not retry:
+                return
+            logging.warning(f"Ollama backend {backend.url} failed, retrying the stream on another node")
+    
+    def stream_chat(self, payload: Dict) -> Iterator[Dict]:
+        """Stream a chat payload, retrying on /api/generate if this Ollama has no /api/chat"""
+        use_chat_api = self.chat_api
+        try:
+            yield from self.stream_ollama(*self.chat_request(payload, use_chat_api))
+        except OllamaStatusError as e:
+            # A missing endpoint fails before any chunk has been yielded
+            if e.status_code != 404 or not use_chat_api:
+                raise
+            yield from self.stream_ollama(*self.chat_request(payload, use_chat_api=False))
+            self.disable_chat_api()
+    
+    def post_chat(self, payload: Dict) -> requests.Response:
+        """POST a chat payload, retrying on /api/generate if this Ollama has no /api/chat"""
+        use_chat_api = self.chat_api
+        response = self.ollama_post(*self.chat_request(payload, use_chat_api))
+        if response.status_code != 404 or not use_chat_api:
+            return response
+        
+        fallback = self.ollama_post(*self.chat_request(payload, use_chat_api=False))
+        # Only a 404 from both means the model is missing rather than the endpoint
+        if fallback.status_code != 404:
+            self.disable_chat_api()
+        return fallback
+    
+    def generate_response_stream(self, prompt: str, max_tokens: int = None, temperature: float = None) -> Iterator[Dict]:
+        """Stream a completion token by token; the final event carries timing and usage"""
+        try:
+            payload = self.build_generate_payload(prompt, max_tokens, temperature, stream=True)
+            
+            for chunk in self.stream_ollama("/api/generate", payload):
+                yield from self.generate_stream_events(chunk)
+                if chunk.get("error"):
+                    return
+                    
+        except requests.exceptions.Timeout:
+            yield {
+                "success": False,
+                "error": "Request timeout - model took too long to respond"
+            }
         except Exception as e:
-            logging.error(f"Error checking model availability: {e}")
+            yield {
+                "success": False,
+                "error": f"Error calling Ollama API: {str(e)}"
+            }
     
-    def generate_response(self, prompt: str, max_tokens: int = None, temperature: float = None) -> Dict:
-        """Generate response using Ollama API"""
+    def chat_completion_stream(self, messages: List[Dict], max_tokens: int = None, temperature: float = None) -> Iterator[Dict]:
+        """Stream a chat completion as content deltas followed by a final usage event"""
         try:
-            payload = {
-                "model": self.model_name,
-                "prompt": prompt,
-                "stream": False,
-                "options": {
-                    "num_predict": max_tokens or self.max_tokens,
-                    "temperature": temperature or self.temperature,
-                    "top_p": 0.9,
-                    "top_k": 40
-                }
+            payload = self.build_chat_payload(messages, max_tokens, temperature, stream=True)
+            
+            for chunk in self.stream_chat(payload):
+                yield from self.chat_stream_events(chunk)
+                if chunk.get("error"):
+                    return
+                    
+        except Exception as e:
+            yield {
+                "success": False,
+                "error": f"Chat completion error: {str(e)}"
             }
+    
+    def request_key(self, operation: str, payload: Dict, priority: str) -> str:
+        """Canonical key for a request: the operation, its priority class and its full Ollama payload"""
+        return hashlib.sha256(json.dumps([operation, priority, payload], sort_keys=True).encode("utf-8")).hexdigest()
+    
+    def coalesce(self, operation: str, payload: Dict, priority: str, fetch) -> Dict:
+        """Run fetch, or join an identical request of the same priority that is already running it
+
+        The leader takes the admission slot, so an interactive request never
+        joins a batch call that is waiting in the batch queue.
+        """
+        if self.single_flight is None:
+            return fetch()
+        
+        output, shared = self.single_flight.do(self.request_key(operation, payload, priority), fetch)
+        if shared:
+            COALESCED_REQUESTS.labels(operation).inc()
+        return output
+    
+    def generate_response(self, prompt: str, max_tokens: int = None, temperature: float = None, use_cache: bool = False,
+                          priority: str = INTERACTIVE) -> Dict:
+        """Generate response using Ollama API"""
+        try:
+            payload = self.build_generate_payload(prompt, max_tokens, temperature)
             
-            response = requests.post(
-                f"{self.ollama_url}/api/generate",
-                json=payload,
-                timeout=120  # 2 minute timeout
-            )
+            cache_key = self.completion_cache_key(payload, use_cache)
+            if cache_key is not None:
+                cached = self.cache.get(cache_key)
+                if cached is not None:
+                    cached["cached"] = True
+                    return cached
             
-            if response.status_code == 200:
-                result = response.json()
-                return {
-                    "success": True,
-                    "generated_text": result.get("response", ""),
-                    "done": result.get("done", False),
-                    "total_duration": result.get("total_duration", 0),
-                    "load_duration": result.get("load_duration", 0),
-                    "prompt_eval_count": result.get("prompt_eval_count", 0),
-                    "eval_count": result.get("eval_count", 0)
-                }
-            else:
-                return {
-                    "success": False,
-                    "error": f"Ollama API returned status {response.status_code}",
-                    "details": response.text
-                }
+            return self.coalesce("generate", payload, priority, lambda: self.fetch_generate(payload, cache_key, priority))
                 
+        except Overloaded:
+            raise
         except requests.exceptions.Timeout:
             return {
                 "success": False,
@@ -82,63 +480,73 @@ class LlamaService:
                 "error": f"Error calling Ollama API: {str(e)}"
             }
     
-    def chat_completion(self, messages: List[Dict], max_tokens: int = None, temperature: float = None) -> Dict:
+    def fetch_generate(self, payload: Dict, cache_key: Optional[str], priority: str = INTERACTIVE) -> Dict:
+        """Call /api/generate in an admission slot and shape, and possibly cache, its result"""
+        with self.admission.slot(priority, self.request_cost(payload)):
+            response = self.ollama_post("/api/generate", payload)
+        
+        if response.status_code == 200:
+            result = response.json()
+            observe_ollama_result(result)
+            output = self.format_generate_result(result)
+            if cache_key is not None:
+                self.cache.put(cache_key, output)
+            return output
+        else:
+            return {
+                "success": False,
+                "error": f"Ollama API returned status {response.status_code}",
+                "details": response.text
+            }
+    
+    def chat_completion(self, messages: List[Dict], max_tokens: int = None, temperature: float = None, use_cache: bool = False,
+                        priority: str = INTERACTIVE) -> Dict:
         """Handle chat-style conversations"""
         try:
-            # Convert messages to a single prompt
-            prompt = self.messages_to_prompt(messages)
+            payload = self.build_chat_payload(messages, max_tokens, temperature)
             
-            payload = {
-                "model": self.model_name,
-                "prompt": prompt,
-                "stream": False,
-                "options": {
-                    "num_predict": max_tokens or self.max_tokens,
-                    "temperature": temperature or self.temperature,
-                    "top_p": 0.9,
-                    "top_k": 40,
-                    "repeat_penalty": 1.1
-                }
-            }
+            cache_key = self.completion_cache_key(payload, use_cache)
+            if cache_key is not None:
+                cached = self.cache.get(cache_key)
+                if cached is not None:
+                    cached["created"] = int(time.time())
+                    cached["cached"] = True
+                    return cached
             
-            response = requests.post(
-                f"{self.ollama_url}/api/generate",
-                json=payload,
-                timeout=120
-            )
-            
-            if response.status_code == 200:
-                result = response.json()
-                return {
-                    "success": True,
-                    "response": result.get("response", ""),
-                    "done": result.get("done", False),
-                    "model": self.model_name,
-                    "created": int(time.time()),
-                    "usage": {
-                        "prompt_tokens": result.get("prompt_eval_count", 0),
-                        "completion_tokens": result.get("eval_count", 0),
-                        "total_tokens": result.get("prompt_eval_count", 0) + result.get("eval_count", 0)
-                    }
-                }
-            else:
-                return {
-                    "success": False,
-                    "error": f"Chat completion failed with status {response.status_code}",
-                    "details": response.text
-                }
+            return self.coalesce("chat", payload, priority, lambda: self.fetch_chat(payload, cache_key, priority))
                 
+        except Overloaded:
+            raise
         except Exception as e:
             return {
                 "success": False,
                 "error": f"Chat completion error: {str(e)}"
             }
     
+    def fetch_chat(self, payload: Dict, cache_key: Optional[str], priority: str = INTERACTIVE) -> Dict:
+        """Call Ollama for a chat payload in an admission slot and shape, and possibly cache, its result"""
+        with self.admission.slot(priority, self.request_cost(payload)):
+            response = self.post_chat(payload)
+        
+        if response.status_code == 200:
+            result = response.json()
+            observe_ollama_result(result)
+            output = self.format_chat_result(result)
+            if cache_key is not None:
+                self.cache.put(cache_key, output)
+            return output
+        else:
+            return {
+                "success": False,
+                "error": f"Chat completion failed with status {response.status_code}",
+                "details": response.text
+            }
+    
     def messages_to_prompt(self, messages: List[Dict]) -> str:
-        """Convert chat messages to a single prompt"""
+        """Convert chat messages, compacted to the history budget, to a single prompt"""
         prompt_parts = []
         
-        for message in messages:
+        for message in compact_messages(messages, self.history_tokens, self.compact_step):
             role = message.get("role", "user")
             content = message.get("content", "")
             
@@ -155,17 +563,76 @@ class LlamaService:
 # Initialize Llama service
 llama_service = LlamaService()
 
+@app.before_request
+def start_request_metrics():
+    if request.endpoint and request.endpoint != 'metrics':
+        g.metrics_started = time.perf_counter()
+        REQUESTS_IN_FLIGHT.labels(request.endpoint).inc()
+
+@app.after_request
+def record_request_metrics(response):
+    # Streaming responses are timed to their first byte; the body is produced after this hook
+    if 'metrics_started' in g:
+        REQUEST_LATENCY.labels(request.endpoint).observe(time.perf_counter() - g.metrics_started)
+        if response.status_code >= 400:
+            ERRORS.labels(request.endpoint, g.get('error_type', f"http_{response.status_code}")).inc()
+    return response
+
+@app.teardown_request
+def finish_request_metrics(exc):
+    # Runs a second time when a streamed body finishes under stream_with_context
+    if g.pop('metrics_started', None) is not None:
+        REQUESTS_IN_FLIGHT.labels(request.endpoint).dec()
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Prometheus metrics"""
+    return Response(generate_latest(), mimetype=CONTENT_TYPE_LATEST)
+
+def overloaded_response(error: Overloaded):
+    """JSON error for a request turned away by admission control, with a Retry-After hint"""
+    g.error_type = "overloaded"
+    return jsonify({"error": error.message}), error.status, {"Retry-After": str(error.retry_after)}
+
+def stream_in_slot(body: Iterator[str], mimetype: str, priority: str, cost: int, headers: Dict = None) -> Response:
+    """Stream a response body while holding an admission slot, freed when the body is closed"""
+    ticket = llama_service.admission.acquire(priority, cost)
+    finished = []
+    
+    def relay() -> Iterator[str]:
+        yield from body
+        finished.append(True)
+    
+    response = Response(stream_with_context(relay()), mimetype=mimetype, headers=headers)
+    # Runs when the body finishes or the client disconnects, even if streaming never started;
+    # streams cut short say nothing about how long a full generation takes
+    response.call_on_close(lambda: llama_service.admission.release(ticket, observe=bool(finished)))
+    return response
+
+def pool_health(backends: List[Dict]) -> str:
+    """healthy if every node is usable, degraded if some are, unhealthy if none"""
+    usable = sum(1 for backend in backends if backend["healthy"] and backend["circuit"] != "open")
+    if usable == len(backends):
+        return "healthy"
+    return "degraded" if usable else "unhealthy"
+
 @app.route('/health', methods=['GET'])
 def health_check():
     try:
-        # Quick health check to Ollama
-        response = requests.get(f"{llama_service.ollama_url}/api/tags", timeout=5)
-        ollama_healthy = response.status_code == 200
+        # Served from the background probes; nodes are probed here only if those have fallen behind
+        llama_service.backend_pool.refresh_stale(llama_service.fetch_tags)
+        backends = llama_service.backend_pool.stats()
+        status = pool_health(backends)
         
         return jsonify({
-            "status": "healthy" if ollama_healthy else "degraded",
-            "ollama_connected": ollama_healthy,
+            "status": status,
+            "ollama_connected": status != "unhealthy",
             "model": llama_service.model_name,
+            "backends": backends,
+            "connection_pool": llama_service.pool_stats(),
+            "cache": llama_service.cache.stats() if llama_service.cache is not None else None,
+            "coalescing": llama_service.single_flight.stats() if llama_service.single_flight is not None else None,
+            "admission": llama_service.admission.stats(),
             "timestamp": int(time.time())
         })
     except Exception as e:
@@ -186,8 +653,11 @@ def generate():
             return jsonify({"error": "Missing required field: prompt"}), 400
         
         prompt = data['prompt']
-        max_tokens = data.get('max_tokens', 1000)
         temperature = data.get('temperature', 0.7)
+        try:
+            max_tokens = llama_service.request_max_tokens(data)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
         
         if not prompt.strip():
             return jsonify({"error": "Prompt cannot be empty"}), 400
@@ -195,17 +665,103 @@ def generate():
         if max_tokens > 4096:
             return jsonify({"error": "max_tokens cannot exceed 4096"}), 400
         
-        result = llama_service.generate_response(prompt, max_tokens, temperature)
+        # Tutor answers are interactive; bulk generation should send "priority": "batch"
+        try:
+            priority = llama_service.request_priority(data, max_tokens)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        
+        if data.get('stream', False):
+            # Newline-delimited JSON, one object per token
+            events = llama_service.generate_response_stream(prompt, max_tokens, temperature)
+            return stream_in_slot(
+                (json.dumps(event) + "\n" for event in events),
+                "application/x-ndjson", priority, max_tokens or llama_service.max_tokens
+            )
+        
+        result = llama_service.generate_response(prompt, max_tokens, temperature, data.get('cache', False), priority)
         
         if result["success"]:
             return jsonify(result)
         else:
             return jsonify(result), 500
             
+    except Overloaded as e:
+        return overloaded_response(e)
     except Exception as e:
         logging.error(f"Error in generate endpoint: {e}")
+        g.error_type = type(e).__name__
         return jsonify({"error": "Internal server error", "details": str(e)}), 500
 
+def format_chat_completion(result: Dict) -> Dict:
+    """Format a chat result to match the OpenAI chat.completion structure"""
+    return {
+        "id": f"chatcmpl-{int(time.time())}",
+        "object": "chat.completion",
+        "created": result["created"],
+        "model": result["model"],
+        "choices": [{
+            "index": 0,
+            "message": {
+                "role": "assistant",
+                "content": result["response"]
+            },
+            "finish_reason": "stop"
+        }],
+        "usage": result["usage"]
+    }
+
+def format_chat_completion_chunk(event: Dict, chunk_id: str, created: int, model: str) -> str:
+    """Format one chat stream event as an OpenAI chat.completion.chunk Server-Sent Event"""
+    if event.get("success") is False:
+        return f"data: {json.dumps({'error': event['error']})}\n\n"
+    
+    chunk = {
+        "id": chunk_id,
+        "object": "chat.completion.chunk",
+        "created": created,
+        "model": model
+    }
+    if event.get("role"):
+        chunk["choices"] = [{"index": 0, "delta": {"role": event["role"]}, "finish_reason": None}]
+    elif event.get("done"):
+        chunk["choices"] = [{"index": 0, "delta": {}, "finish_reason": "stop"}]
+        chunk["usage"] = event["usage"]
+    else:
+        chunk["choices"] = [{"index": 0, "delta": {"content": event["content"]}, "finish_reason": None}]
+    return f"data: {json.dumps(chunk)}\n\n"
+
+def format_chat_completion_chunks(events: Iterator[Dict]) -> Iterator[str]:
+    """Format streamed chat events as OpenAI chat.completion.chunk Server-Sent Events"""
+    created = int(time.time())
+    chunk_id = f"chatcmpl-{created}"
+    model = llama_service.model_name
+    
+    yield format_chat_completion_chunk({"role": "assistant"}, chunk_id, created, model)
+    
+    for event in events:
+        yield format_chat_completion_chunk(event, chunk_id, created, model)
+        if event.get("success") is False:
+            break
+    
+    yield "data: [DONE]\n\n"
+
+def format_model_list(ollama_models: List[Dict]) -> Dict:
+    """Format Ollama's model tags to match the OpenAI model list structure"""
+    models = []
+    for model in ollama_models:
+        models.append({
+            "id": model['name'],
+            "object": "model",
+            "created": int(time.time()),
+            "owned_by": "ollama"
+        })
+    
+    return {
+        "object": "list",
+        "data": models
+    }
+
 @app.route('/chat/completions', methods=['POST'])
 def chat_completions():
     """OpenAI-compatible chat completions endpoint"""
@@ -216,62 +772,52 @@ def chat_completions():
             return jsonify({"error": "Missing required field: messages"}), 400
         
         messages = data['messages']
-        max_tokens = data.get('max_tokens', 1000)
         temperature = data.get('temperature', 0.7)
+        try:
+            max_tokens = llama_service.request_max_tokens(data)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
         
         if not isinstance(messages, list) or len(messages) == 0:
             return jsonify({"error": "messages must be a non-empty list"}), 400
         
-        result = llama_service.chat_completion(messages, max_tokens, temperature)
+        try:
+            priority = llama_service.request_priority(data, max_tokens)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        
+        if data.get('stream', False):
+            events = llama_service.chat_completion_stream(messages, max_tokens, temperature)
+            return stream_in_slot(
+                format_chat_completion_chunks(events),
+                "text/event-stream", priority, max_tokens or llama_service.max_tokens,
+                headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+            )
+        
+        result = llama_service.chat_completion(messages, max_tokens, temperature, data.get('cache', False), priority)
         
         if result["success"]:
             # Format response to match OpenAI API structure
-            formatted_response = {
-                "id": f"chatcmpl-{int(time.time())}",
-                "object": "chat.completion",
-                "created": result["created"],
-                "model": result["model"],
-                "choices": [{
-                    "index": 0,
-                    "message": {
-                        "role": "assistant",
-                        "content": result["response"]
-                    },
-                    "finish_reason": "stop"
-                }],
-                "usage": result["usage"]
-            }
-            return jsonify(formatted_response)
+            return jsonify(format_chat_completion(result))
         else:
             return jsonify(result), 500
             
+    except Overloaded as e:
+        return overloaded_response(e)
     except Exception as e:
         logging.error(f"Error in chat completions endpoint: {e}")
+        g.error_type = type(e).__name__
         return jsonify({"error": "Internal server error", "details": str(e)}), 500
 
 @app.route('/models', methods=['GET'])
 def list_models():
-    """List available models"""
+    """List models available across the Ollama nodes"""
     try:
-        response = requests.get(f"{llama_service.ollama_url}/api/tags", timeout=10)
+        llama_service.backend_pool.refresh_stale(llama_service.fetch_tags)
         
-        if response.status_code == 200:
-            ollama_models = response.json().get('models', [])
-            
+        if any(backend.healthy for backend in llama_service.backend_pool.backends):
             # Format to match OpenAI API structure
-            models = []
-            for model in ollama_models:
-                models.append({
-                    "id": model['name'],
-                    "object": "model",
-                    "created": int(time.time()),
-                    "owned_by": "ollama"
-                })
-            
-            return jsonify({
-                "object": "list",
-                "data": models
-            })
+            return jsonify(format_model_list(llama_service.backend_pool.models()))
         else:
             return jsonify({"error": "Could not fetch models from Ollama"}), 500
             
@@ -0,0 +1,81 @@
+from typing import Dict
+
+from prometheus_client import Counter, Gauge, Histogram
+
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120)
+
+REQUEST_LATENCY = Histogram(
+    "llama_request_latency_seconds", "Time to produce a response, by endpoint",
+    ["endpoint"], buckets=LATENCY_BUCKETS
+)
+REQUESTS_IN_FLIGHT = Gauge(
+    "llama_requests_in_flight", "Requests currently being handled, by endpoint", ["endpoint"]
+)
+ERRORS = Counter(
+    "llama_errors_total", "Failed requests, by endpoint and error type", ["endpoint", "error_type"]
+)
+
+OLLAMA_LOAD_SECONDS = Histogram(
+    "llama_ollama_load_seconds", "Ollama model load time per completion", buckets=LATENCY_BUCKETS
+)
+OLLAMA_PROMPT_EVAL_SECONDS = Histogram(
+    "llama_ollama_prompt_eval_seconds", "Ollama prompt evaluation time per completion", buckets=LATENCY_BUCKETS
+)
+OLLAMA_EVAL_SECONDS = Histogram(
+    "llama_ollama_eval_seconds", "Ollama token generation time per completion", buckets=LATENCY_BUCKETS
+)
+OLLAMA_TOKENS_PER_SECOND = Histogram(
+    "llama_ollama_tokens_per_second", "Generated tokens per second per completion",
+    buckets=(1, 2, 5, 10, 15, 20, 30, 40, 60, 80, 120, 200)
+)
+OLLAMA_ERRORS = Counter(
+    "llama_ollama_errors_total", "Failed calls to Ollama, by error type", ["error_type"]
+)
+COALESCED_REQUESTS = Counter(
+    "llama_coalesced_requests_total", "Requests served by joining an identical in-flight call, by operation",
+    ["operation"]
+)
+ADMISSION_QUEUE_DEPTH = Gauge(
+    "llama_admission_queue_depth", "Requests waiting for a generation slot, by priority class", ["priority"]
+)
+ADMISSION_ACTIVE = Gauge(
+    "llama_admission_active", "Requests holding a generation slot, by priority class", ["priority"]
+)
+ADMISSION_WAIT = Histogram(
+    "llama_admission_wait_seconds", "Time a request waited for a generation slot, by priority class",
+    ["priority"], buckets=LATENCY_BUCKETS
+)
+ADMISSION_REJECTED = Counter(
+    "llama_admission_rejected_total", "Requests turned away by admission control, by priority class and reason",
+    ["priority", "reason"]
+)
+PROMPT_TOKENS = Counter("llama_prompt_tokens_total", "Prompt tokens evaluated by Ollama")
+COMPLETION_TOKENS = Counter("llama_completion_tokens_total", "Completion tokens generated by Ollama")
+
+
+def observe_ollama_result(result: Dict):
+    """Record the timing and token counts Ollama reports on a finished completion"""
+    # Ollama reports durations in nanoseconds
+    load = result.get("load_duration", 0) / 1e9
+    prompt_eval = result.get("prompt_eval_duration", 0) / 1e9
+    eval_seconds = result.get("eval_duration", 0) / 1e9
+    eval_count = result.get("eval_count", 0)
+
+    if load:
+        OLLAMA_LOAD_SECONDS.observe(load)
+    if prompt_eval:
+        OLLAMA_PROMPT_EVAL_SECONDS.observe(prompt_eval)
+    if eval_seconds:
+        OLLAMA_EVAL_SECONDS.observe(eval_seconds)
+        OLLAMA_TOKENS_PER_SECOND.observe(eval_count / eval_seconds)
+
+    PROMPT_TOKENS.inc(result.get("prompt_eval_count", 0))
+    COMPLETION_TOKENS.inc(eval_count)
+
+
+def observe_ollama_chunk(chunk: Dict):
+    """Record an in-band error or the final statistics of a streamed Ollama chunk"""
+    if chunk.get("error"):
+        OLLAMA_ERRORS.labels("ollama_error").inc()
+    elif chunk.get("done", False):
+        observe_ollama_result(chunk)
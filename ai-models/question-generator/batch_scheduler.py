@@ -0,0 +1,130 @@
+import logging
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, Dict, List
+
+from common.admission import BATCH, INTERACTIVE, WeightedRoundRobin
+from metrics import QUEUE_WAIT
+
+
+class MicroBatchScheduler:
+    """Queue encoder inputs from concurrent requests and run them as shared batches.
+
+    A background thread flushes the queue when it holds max_batch_size inputs
+    or when the oldest queued input has waited max_wait_ms, whichever comes
+    first. Only inputs asking for the same number of candidates share a batch.
+    Each caller blocks only on the futures for its own inputs. Inputs carry
+    the priority class of their request: each batch is led by the oldest
+    input of a class chosen by weighted round robin, and is filled with that
+    class's inputs before any others, so interactive questions overtake a
+    backlog of bulk inputs without starving it.
+    """
+
+    def __init__(self, run_batch: Callable[[List[str], int], List[List[str]]], max_batch_size: int = 8, max_wait_ms: float = 5.0,
+                 weights: Dict[str, int] = None):
+        self.run_batch = run_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self._queue = []  # (input_text, future, enqueued_at, num_candidates, priority)
+        self._round_robin = WeightedRoundRobin(weights or {INTERACTIVE: 4, BATCH: 1})
+        self._cond = threading.Condition()
+        self._thread = None
+        self._stats = {
+            "batches": 0,
+            "items": 0,
+            "total_queue_wait": 0.0,
+            "max_queue_wait": 0.0,
+        }
+
+    def start(self):
+        """Start the flush thread if it is not already running"""
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name="micro-batch-scheduler", daemon=True)
+            self._thread.start()
+
+    def submit(self, input_text: str, num_candidates: int = 1, priority: str = INTERACTIVE) -> Future:
+        """Queue a single input and return a future for its generated candidates"""
+        future = Future()
+        with self._cond:
+            self._queue.append((input_text, future, time.monotonic(), num_candidates, priority))
+            self._cond.notify()
+        return future
+
+    def generate(self, input_texts: List[str], num_candidates: int = 1, priority: str = INTERACTIVE) -> List[List[str]]:
+        """Queue all inputs of one request and wait for their results in order"""
+        futures = [self.submit(text, num_candidates, priority) for text in input_texts]
+        return [future.result() for future in futures]
+
+    def _next_batch(self) -> List:
+        """Block until a batch is full or its deadline passes, then pop it"""
+        with self._cond:
+            while not self._queue:
+                self._cond.wait()
+
+            # The oldest input sets the deadline of this flush
+            deadline = self._queue[0][2] + self.max_wait
+            num_candidates = self._queue[0][3]
+            while sum(1 for item in self._queue if item[3] == num_candidates) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+
+            # The oldest input of the chosen class sets the candidate count of this batch
+            priority = self._round_robin.pick(list(dict.fromkeys(item[4] for item in self._queue)))
+            lead = next(item for item in self._queue if item[4] == priority)
+            num_candidates = lead[3]
+
+            ordered = sorted(self._queue, key=lambda item: item[4] != priority)
+            batch = [item for item in ordered if item[3] == num_candidates][:self.max_batch_size]
+            chosen = set(id(item) for item in batch)
+            self._queue = [item for item in self._queue if id(item) not in chosen]
+            return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            started = time.monotonic()
+            self._record(batch, started)
+
+            try:
+                results = self.run_batch([item[0] for item in batch], batch[0][3])
+            except Exception as e:
+                logging.error(f"Error running micro-batch: {e}")
+                for item in batch:
+                    item[1].set_exception(e)
+                continue
+
+            for item, result in zip(batch, results):
+                item[1].set_result(result)
+
+    def _record(self, batch: List, started: float):
+        with self._cond:
+            waits = [started - item[2] for item in batch]
+            self._stats["batches"] += 1
+            self._stats["items"] += len(batch)
+            self._stats["total_queue_wait"] += sum(waits)
+            self._stats["max_queue_wait"] = max(self._stats["max_queue_wait"], max(waits))
+        for wait in waits:
+            QUEUE_WAIT.observe(wait)
+
+    def stats(self) -> Dict:
+        """Return batch fill ratio and queue wait counters"""
+        with self._cond:
+            batches = self._stats["batches"]
+            items = self._stats["items"]
+            return {
+                "max_batch_size": self.max_batch_size,
+                "max_wait_ms": self.max_wait * 1000.0,
+                "queue_depth": len(self._queue),
+                "queue_depth_by_priority": {
+                    priority: sum(1 for item in self._queue if item[4] == priority)
+                    for priority in self._round_robin.weights
+                },
+                "batches": batches,
+                "items": items,
+                "avg_batch_fill_ratio": items / (batches * self.max_batch_size) if batches else 0.0,
+                "avg_queue_wait_ms": self._stats["total_queue_wait"] / items * 1000.0 if items else 0.0,
+                "max_queue_wait_ms": self._stats["max_queue_wait"] * 1000.0,
+            }
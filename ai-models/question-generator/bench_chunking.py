@@ -0,0 +1,115 @@
+"""Benchmark the token-aware chunker on long synthetic documents.
+
+Compares preprocess_text against the previous character-based chunker
+(which kept only the first 5 chunks) for documents of increasing length and
+reports run time, chunk counts, document coverage and the largest chunk in
+tokens. Only the tokenizer is loaded; QG_MODEL_PATH points it at a local
+snapshot.
+
+    python bench_chunking.py --pages 25 50 100
+"""
+import argparse
+import json
+import random
+import os
+import re
+import sys
+import time
+from typing import List
+
+from transformers import AutoTokenizer
+
+# ai-models/, where t5_question_generator finds the common package
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from t5_question_generator import T5QuestionGenerator, ANSWER_PREFIX_TOKENS
+
+WORDS_PER_PAGE = 500
+
+VOCABULARY = (
+    "energy cell membrane protein Newton gravity force mass orbit planet Europe revolution "
+    "parliament treaty economy market supply demand photosynthesis chlorophyll enzyme "
+    "molecule atom electron nucleus reaction equation theory evidence experiment result"
+).split()
+
+
+def synthetic_document(pages: int, seed: int = 0) -> str:
+    rng = random.Random(seed)
+    sentences = []
+    words = 0
+    while words < pages * WORDS_PER_PAGE:
+        length = rng.randint(6, 30)
+        sentence = " ".join(rng.choice(VOCABULARY) for _ in range(length))
+        sentences.append(sentence.capitalize() + rng.choice([".", ".", ".", "?", "!"]))
+        words += length
+    return " ".join(sentences)
+
+
+def legacy_preprocess_text(text: str, max_length: int = 512) -> List[str]:
+    """The chunker preprocess_text replaced, kept here as the baseline"""
+    sentences = re.split(r'[.!?]+', text)
+    chunks = []
+    current_chunk = ""
+
+    for sentence in sentences:
+        sentence = sentence.strip()
+        if not sentence:
+            continue
+
+        if len(current_chunk + sentence) < max_length:
+            current_chunk += sentence + ". "
+        else:
+            if current_chunk:
+                chunks.append(current_chunk.strip())
+            current_chunk = sentence + ". "
+
+    if current_chunk:
+        chunks.append(current_chunk.strip())
+
+    return chunks[:5]
+
+
+def measure(name: str, chunker, text: str, tokenizer, repeats: int) -> dict:
+    started = time.perf_counter()
+    for _ in range(repeats):
+        chunks = chunker(text)
+    elapsed = (time.perf_counter() - started) / repeats
+
+    token_counts = [len(tokenizer(chunk, add_special_tokens=False, verbose=False)["input_ids"]) for chunk in chunks]
+    covered_words = sum(len(chunk.split()) for chunk in chunks)
+    return {
+        "chunker": name,
+        "seconds": round(elapsed, 4),
+        "chunks": len(chunks),
+        "coverage": round(min(1.0, covered_words / len(text.split())), 4),
+        "max_chunk_tokens": max(token_counts) if token_counts else 0
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--pages", type=int, nargs="+", default=[25, 50, 100])
+    parser.add_argument("--overlap", type=int, default=0, help="Chunk overlap in tokens")
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    generator = T5QuestionGenerator(load=False)
+    generator.tokenizer = AutoTokenizer.from_pretrained(generator.model_path or generator.model_name)
+    generator.chunk_overlap = args.overlap
+
+    results = []
+    for pages in args.pages:
+        text = synthetic_document(pages)
+        for name, chunker in (("legacy", legacy_preprocess_text), ("token_aware", generator.preprocess_text)):
+            result = measure(name, chunker, text, generator.tokenizer, args.repeats)
+            result["pages"] = pages
+            results.append(result)
+
+    print(json.dumps({
+        "token_budget": 512 - ANSWER_PREFIX_TOKENS,
+        "overlap": args.overlap,
+        "results": results
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
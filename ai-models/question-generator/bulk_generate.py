@@ -0,0 +1,293 @@
+"""Generate questions for a whole corpus offline, without going through question_service.
+
+Streams documents from a JSONL file (one object per line with a text field)
+or from a directory of .txt and .md files, packs the question inputs of many
+documents into large model batches and spreads those batches over worker
+processes. The workers share the loaded model copy-on-write and each is
+pinned to its own slice of cores. Results are appended to a JSONL file in
+corpus order, one line per document. A checkpoint is written after every
+round of documents, so an interrupted run resumes where it stopped when the
+same command is run again.
+
+Documents of one round share a single resolve_questions call. Identical
+(answer, chunk) pairs in the round are generated once and given the same
+question, and with --num-candidates above 1 a candidate that repeats a
+question already chosen for another document of the round is ranked lower.
+A document's output therefore depends on the documents it shares a round
+with, so --docs-per-round is part of the checkpoint settings. Nothing is
+shared across rounds apart from the question cache.
+
+    python bulk_generate.py corpus.jsonl --output questions.jsonl
+    python bulk_generate.py course_docs/ --output questions.jsonl --workers 4 --max-questions 10
+"""
+import argparse
+import gc
+import json
+import logging
+import multiprocessing
+import os
+import signal
+import sys
+import time
+from collections import deque
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import torch
+
+from prefork import core_slices
+# t5_question_generator imports the common package from ai-models/
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from t5_question_generator import T5QuestionGenerator
+
+DOCUMENT_EXTENSIONS = (".txt", ".md")
+
+# Loaded in the parent before the workers fork, so they all share its weights
+generator: Optional[T5QuestionGenerator] = None
+
+
+def iter_documents(source: str, text_field: str = "text", id_field: str = "id",
+                   skip: int = 0) -> Iterator[Tuple[str, Optional[str]]]:
+    """Yield (doc_id, text) in a stable order, skipping the first skip documents without reading them
+
+    text is None for a JSONL line that is not a valid JSON object.
+    """
+    if os.path.isdir(source):
+        paths = sorted(
+            os.path.join(root, name)
+            for root, _, names in os.walk(source)
+            for name in names if name.lower().endswith(DOCUMENT_EXTENSIONS)
+        )
+        for path in paths[skip:]:
+            with open(path, encoding="utf-8", errors="replace") as f:
+                yield os.path.relpath(path, source), f.read()
+        return
+
+    index = 0
+    with open(source, encoding="utf-8") as f:
+        for line_number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            index += 1
+            if index <= skip:
+                continue
+            try:
+                record = json.loads(line)
+                yield str(record.get(id_field, index - 1)), record.get(text_field) or ""
+            except (ValueError, AttributeError):
+                yield f"line-{line_number}", None
+
+
+def iter_rounds(documents: Iterator[Tuple[str, Optional[str]]], size: int) -> Iterator[List[Tuple[str, Optional[str]]]]:
+    """Group the document stream into rounds of size documents"""
+    batch = []
+    for document in documents:
+        batch.append(document)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def process_round(documents: List[Tuple[str, Optional[str]]], max_questions: int, num_candidates: int) -> List[Dict]:
+    """Generate questions for a round of documents, with all their model inputs in shared batches
+
+    Identical inputs across the round's documents are generated once, and
+    candidates are ranked against every question chosen so far in the round.
+    """
+    results = []
+    plans = []
+    for doc_id, text in documents:
+        result = {"id": doc_id}
+        results.append(result)
+        if text is None:
+            result["error"] = "Invalid JSON record"
+            continue
+        try:
+            pairs, analyses = generator.plan_questions(text, max_questions) if text.strip() else ([], {})
+            plans.append((result, pairs, analyses))
+        except Exception as e:
+            result["error"] = f"Preprocessing failed: {e}"
+
+    # One pass over every document's inputs, so model batches are filled across documents
+    try:
+        generated = generator.resolve_questions([pair for _, pairs, _ in plans for pair in pairs], num_candidates)
+    except Exception as e:
+        logging.error(f"Error generating questions for documents {documents[0][0]}..{documents[-1][0]}: {e}")
+        for result, _, _ in plans:
+            result["error"] = f"Generation failed: {e}"
+        return results
+
+    offset = 0
+    for result, pairs, analyses in plans:
+        result["questions"] = generator.assemble_questions(pairs, generated[offset:offset + len(pairs)], analyses)
+        result["total_generated"] = len(result["questions"])
+        offset += len(pairs)
+    return results
+
+
+def init_worker(slices: multiprocessing.Queue):
+    """Pin a forked worker to the next free slice of cores"""
+    # Ctrl+C is handled by the parent, which terminates the pool
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    cores = slices.get()
+    os.sched_setaffinity(0, cores)
+    torch.set_num_threads(len(cores))
+
+
+def run_rounds(rounds: Iterator[List], pool, window: int, *args) -> Iterator[List[Dict]]:
+    """Yield each round's results in corpus order, with at most window rounds in flight"""
+    if pool is None:
+        for documents in rounds:
+            yield process_round(documents, *args)
+        return
+
+    pending = deque()
+    for documents in rounds:
+        pending.append(pool.apply_async(process_round, (documents, *args)))
+        if len(pending) >= window:
+            yield pending.popleft().get()
+    while pending:
+        yield pending.popleft().get()
+
+
+def load_checkpoint(path: str, settings: Dict) -> Dict:
+    """Return the saved progress of an earlier run with the same settings"""
+    with open(path, encoding="utf-8") as f:
+        checkpoint = json.load(f)
+    if checkpoint["settings"] != settings:
+        raise SystemExit(
+            f"Checkpoint {path} was written with different settings ({checkpoint['settings']}); "
+            f"rerun with --restart to start over"
+        )
+    return checkpoint
+
+
+def save_checkpoint(path: str, checkpoint: Dict):
+    """Replace the checkpoint atomically so a crash never leaves it half written"""
+    temporary = f"{path}.tmp"
+    with open(temporary, "w", encoding="utf-8") as f:
+        json.dump(checkpoint, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temporary, path)
+
+
+def main():
+    global generator
+
+    cores = len(os.sched_getaffinity(0))
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("source", help="JSONL file or directory of .txt/.md documents")
+    parser.add_argument("--output", required=True, help="JSONL file to append one result per document to")
+    parser.add_argument("--text-field", default="text", help="JSONL field holding the document text")
+    parser.add_argument("--id-field", default="id", help="JSONL field holding the document id")
+    parser.add_argument("--max-questions", type=int, default=10, help="Questions per document")
+    parser.add_argument("--num-candidates", type=int, default=1, help="Candidates decoded per question")
+    # A few threads per process keeps each model.generate efficient while the processes fill the machine
+    parser.add_argument("--workers", type=int, default=max(1, cores // 4), help="Worker processes")
+    parser.add_argument("--batch-size", type=int, default=32, help="Encoder inputs per model batch")
+    parser.add_argument("--memory-budget-mb", type=int,
+                        help="Activation memory per worker; batches are split to fit (default: QG_MEMORY_BUDGET_MB)")
+    parser.add_argument("--docs-per-round", type=int, default=16,
+                        help="Documents whose inputs are packed together; also the checkpoint interval")
+    parser.add_argument("--restart", action="store_true", help="Ignore any checkpoint and overwrite the output")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    # With several workers the parent loads the model single-threaded, as question_service does,
+    # so the forked workers inherit no OpenMP thread pool
+    generator = T5QuestionGenerator(max_batch_size=args.batch_size, load=False,
+                                    num_threads=1 if args.workers > 1 else None)
+    generator.single_flight = None
+    if args.memory_budget_mb is not None:
+        generator.memory.budget_bytes = args.memory_budget_mb * 1024 * 1024
+
+    checkpoint_path = f"{args.output}.checkpoint"
+    settings = {
+        "source": os.path.abspath(args.source),
+        "max_questions": args.max_questions,
+        "num_candidates": args.num_candidates,
+        "model": generator.model_path or generator.model_name,
+        # Documents of a round share generations, so a different grouping changes the output
+        "docs_per_round": args.docs_per_round
+    }
+
+    checkpoint = {"settings": settings, "documents": 0, "questions": 0, "output_bytes": 0}
+    if not args.restart and os.path.exists(checkpoint_path):
+        checkpoint = load_checkpoint(checkpoint_path, settings)
+        logging.info(f"Resuming after {checkpoint['documents']} documents")
+    elif not args.restart and os.path.exists(args.output) and os.path.getsize(args.output) > 0:
+        raise SystemExit(f"{args.output} exists without a checkpoint; rerun with --restart to overwrite it")
+    elif os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+    written = os.path.getsize(args.output) if os.path.exists(args.output) else 0
+    if written < checkpoint["output_bytes"]:
+        raise SystemExit(f"{args.output} is shorter than its checkpoint records; rerun with --restart to start over")
+    # Drop any results written after the last checkpoint; their documents are generated again
+    with open(args.output, "ab") as f:
+        f.truncate(checkpoint["output_bytes"])
+
+    generator.load_model()
+
+    pool = None
+    if args.workers > 1:
+        # Keep the loaded model out of the GC's reach so the workers do not copy its pages
+        gc.collect()
+        gc.freeze()
+        context = multiprocessing.get_context("fork")
+        slices = context.Queue()
+        for cores_slice in core_slices(args.workers):
+            slices.put(cores_slice)
+        pool = context.Pool(args.workers, initializer=init_worker, initargs=(slices,))
+
+    documents = iter_documents(args.source, args.text_field, args.id_field, skip=checkpoint["documents"])
+    rounds = iter_rounds(documents, args.docs_per_round)
+    started = time.perf_counter()
+    processed = 0
+    generated = 0
+    failed = 0
+    try:
+        with open(args.output, "ab") as output:
+            for results in run_rounds(rounds, pool, 2 * args.workers, args.max_questions, args.num_candidates):
+                for result in results:
+                    output.write((json.dumps(result) + "\n").encode("utf-8"))
+                    generated += result.get("total_generated", 0)
+                    failed += "error" in result
+                output.flush()
+                os.fsync(output.fileno())
+                processed += len(results)
+
+                checkpoint["documents"] += len(results)
+                checkpoint["questions"] += sum(result.get("total_generated", 0) for result in results)
+                checkpoint["output_bytes"] = output.tell()
+                save_checkpoint(checkpoint_path, checkpoint)
+
+                elapsed = time.perf_counter() - started
+                logging.info(f"{checkpoint['documents']} documents done: {processed / elapsed:.2f} docs/s, "
+                             f"{generated / elapsed:.1f} questions/s")
+    except KeyboardInterrupt:
+        logging.warning(f"Interrupted after {checkpoint['documents']} documents; run the same command to resume")
+        raise SystemExit(130)
+    finally:
+        if pool is not None:
+            pool.terminate()
+
+    elapsed = time.perf_counter() - started
+    print(json.dumps({
+        "documents": processed,
+        "documents_total": checkpoint["documents"],
+        "failed_documents": failed,
+        "questions": generated,
+        "questions_total": checkpoint["questions"],
+        "elapsed_seconds": round(elapsed, 3),
+        "documents_per_second": round(processed / elapsed, 3) if elapsed else 0.0,
+        "questions_per_second": round(generated / elapsed, 3) if elapsed else 0.0,
+        "workers": args.workers,
+        "batch_size": args.batch_size,
+        "output": args.output
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
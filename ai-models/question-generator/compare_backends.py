@@ -0,0 +1,126 @@
+"""Check question quality and speed of a CPU inference backend against the fp32 baseline.
+
+Both models decode greedily over the same (answer, chunk) pairs so their
+outputs are directly comparable. Prints a JSON report and exits non-zero if
+the candidate's mean token F1 against the baseline falls below --min-f1.
+
+    python compare_backends.py --backend int8 --input lecture.txt
+"""
+import argparse
+import io
+import json
+import logging
+import os
+import sys
+import time
+from typing import Dict, List
+
+import torch
+
+# Needed by t5_question_generator's imports of the common package
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from t5_question_generator import T5QuestionGenerator
+
+SAMPLE_TEXT = (
+    "Photosynthesis is the process by which green plants convert light energy into chemical energy. "
+    "Chlorophyll in the chloroplasts absorbs sunlight, which drives the splitting of water molecules. "
+    "The Calvin cycle then fixes carbon dioxide into glucose. "
+    "Mitochondria release the stored energy through cellular respiration, producing adenosine triphosphate. "
+    "The French Revolution began in 1789 and transformed the political landscape of Europe. "
+    "Napoleon Bonaparte rose to power during the later stages of the revolution. "
+    "Newton described gravity as a force that attracts every mass towards every other mass. "
+    "Einstein later explained gravitation as the curvature of spacetime in general relativity."
+)
+
+GREEDY_PARAMS = {"max_length": 64, "do_sample": False, "num_beams": 1}
+
+
+def weight_bytes(model: torch.nn.Module) -> int:
+    """Serialized size of the model's state dict, including packed int8 weights"""
+    buffer = io.BytesIO()
+    torch.save(model.state_dict(), buffer)
+    return buffer.tell()
+
+
+def token_f1(candidate: str, reference: str) -> float:
+    candidate_tokens = candidate.lower().split()
+    reference_tokens = reference.lower().split()
+    if not candidate_tokens or not reference_tokens:
+        return float(candidate_tokens == reference_tokens)
+
+    remaining = list(reference_tokens)
+    common = 0
+    for token in candidate_tokens:
+        if token in remaining:
+            remaining.remove(token)
+            common += 1
+    if common == 0:
+        return 0.0
+
+    precision = common / len(candidate_tokens)
+    recall = common / len(reference_tokens)
+    return 2 * precision * recall / (precision + recall)
+
+
+def timed_generation(generator: T5QuestionGenerator, input_texts: List[str]) -> Dict:
+    started = time.perf_counter()
+    questions = generator.generate_question_texts(input_texts)
+    elapsed = time.perf_counter() - started
+    return {
+        "questions": questions,
+        "seconds": elapsed,
+        "ms_per_question": elapsed / len(input_texts) * 1000.0
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--backend", required=True, choices=["int8", "compile"], help="Backend to compare against eager fp32")
+    parser.add_argument("--input", help="Text file to generate questions from (defaults to a built-in passage)")
+    parser.add_argument("--max-questions", type=int, default=20)
+    parser.add_argument("--threads", type=int, default=None, help="Intra-op threads for both backends")
+    parser.add_argument("--min-f1", type=float, default=0.8, help="Minimum mean token F1 against the baseline")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    text = open(args.input, encoding="utf-8").read() if args.input else SAMPLE_TEXT
+
+    baseline = T5QuestionGenerator(max_batch_size=1, inference_backend="eager", num_threads=args.threads)
+    candidate = T5QuestionGenerator(max_batch_size=1, inference_backend=args.backend, num_threads=args.threads)
+    for generator in (baseline, candidate):
+        generator.generation_params = dict(GREEDY_PARAMS)
+
+    pairs = baseline.collect_answer_pairs(baseline.preprocess_text(text), args.max_questions)
+    input_texts = [f"answer: {answer} context: {chunk}" for answer, chunk in pairs]
+
+    reference = timed_generation(baseline, input_texts)
+    result = timed_generation(candidate, input_texts)
+
+    f1_scores = [token_f1(c, r) for c, r in zip(result["questions"], reference["questions"])]
+    exact = sum(c == r for c, r in zip(result["questions"], reference["questions"]))
+    mean_f1 = sum(f1_scores) / len(f1_scores) if f1_scores else 0.0
+
+    report = {
+        "backend": args.backend,
+        "questions": len(input_texts),
+        "exact_match_rate": exact / len(input_texts) if input_texts else 0.0,
+        "mean_token_f1": mean_f1,
+        "baseline_ms_per_question": reference["ms_per_question"],
+        "candidate_ms_per_question": result["ms_per_question"],
+        "speedup": reference["seconds"] / result["seconds"] if result["seconds"] else None,
+        "baseline_weight_mb": weight_bytes(baseline.model) / 1e6,
+        "candidate_weight_mb": weight_bytes(candidate.model) / 1e6,
+        "samples": [
+            {"answer": answer, "baseline": r, "candidate": c}
+            for (answer, _), r, c in list(zip(pairs, reference["questions"], result["questions"]))[:5]
+        ]
+    }
+    print(json.dumps(report, indent=2))
+
+    if mean_f1 < args.min_f1:
+        logging.error(f"Mean token F1 {mean_f1:.3f} is below the {args.min_f1} threshold")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+import re
+from typing import Dict, List
+
+import numpy as np
+
+# Capitalized words or lowercase words of 4+ letters
+CONCEPT_PATTERN = re.compile(r'\b[A-Z][a-z]+\b|\b[a-z]{4,}\b')
+
+STOP_WORDS = frozenset({
+    'this', 'that', 'with', 'have', 'will', 'from', 'they', 'been', 'were', 'said', 'each',
+    'which', 'their', 'time', 'more', 'very', 'when', 'come', 'here', 'there', 'could', 'other'
+})
+
+
+class ChunkAnalysis:
+    """Concepts found in one chunk, computed in a single regex pass.
+
+    concepts holds each concept once, in order of first appearance and in the
+    form it first appeared; frequencies and positions are keyed by its
+    lowercase form.
+    """
+
+    def __init__(self, text: str):
+        self.text = text
+        self.concepts = []
+        self.frequencies = {}
+        self.positions = {}
+
+        for match in CONCEPT_PATTERN.finditer(text):
+            word = match.group()
+            key = word.lower()
+            if key in STOP_WORDS or len(word) <= 3:
+                continue
+
+            if key not in self.frequencies:
+                self.concepts.append(word)
+                self.frequencies[key] = 0
+                self.positions[key] = []
+            self.frequencies[key] += 1
+            self.positions[key].append(match.start())
+
+    def key_concepts(self, limit: int = 10) -> List[str]:
+        """The first concepts in the chunk, which serve as candidate answers"""
+        return self.concepts[:limit]
+
+
+class DistractorIndex:
+    """Document-level TF-IDF index for picking multiple choice distractors.
+
+    Candidates are scored by how strongly they co-occur with the answer
+    across the document's chunks (cosine similarity of their TF-IDF columns)
+    plus their TF-IDF weight in the answer's own chunk, with a small bonus for
+    matching the answer's capitalization (proper noun vs common word).
+    """
+
+    def __init__(self, analyses: Dict[str, ChunkAnalysis]):
+        self.rows = {chunk: row for row, chunk in enumerate(analyses)}
+        self.vocabulary = {}
+        self.surface_forms = []
+
+        for analysis in analyses.values():
+            for concept in analysis.concepts:
+                key = concept.lower()
+                if key not in self.vocabulary:
+                    self.vocabulary[key] = len(self.surface_forms)
+                    self.surface_forms.append(concept)
+
+        counts = np.zeros((len(analyses), len(self.surface_forms)), dtype=np.float32)
+        for row, analysis in enumerate(analyses.values()):
+            columns = [self.vocabulary[key] for key in analysis.frequencies]
+            counts[row, columns] = list(analysis.frequencies.values())
+
+        document_frequency = (counts > 0).sum(axis=0)
+        idf = np.log((1 + len(analyses)) / (1 + document_frequency)) + 1
+        self.tfidf = counts * idf
+
+        norms = np.linalg.norm(self.tfidf, axis=0)
+        self.columns = self.tfidf / np.where(norms > 0, norms, 1)
+        self.capitalized = np.array([form[:1].isupper() for form in self.surface_forms], dtype=bool)
+
+    def distractors(self, answer: str, chunk: str, count: int = 3) -> List[str]:
+        """Return up to count concepts most related to the answer, best first"""
+        column = self.vocabulary.get(answer.lower())
+        row = self.rows.get(chunk)
+        if column is None or row is None:
+            return []
+
+        scores = self.columns.T @ self.columns[:, column]
+        scores = scores + self.tfidf[row] / max(self.tfidf[row].max(), 1e-6)
+        scores = scores + 0.25 * (self.capitalized == answer[:1].isupper())
+        scores[column] = -np.inf
+
+        # Stable sort keeps document order among equal scores
+        ranked = np.argsort(-scores, kind="stable")[:count]
+        return [self.surface_forms[i] for i in ranked if np.isfinite(scores[i])]
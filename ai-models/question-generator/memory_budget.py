@@ -0,0 +1,237 @@
+import threading
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+from metrics import MEMORY_RESERVED
+
+STATUS_PATH = "/proc/self/status"
+CLEAR_REFS_PATH = "/proc/self/clear_refs"
+
+# Smaller batches are dominated by fixed per-call allocations and say little about the per-token cost
+MIN_SAMPLE_TOKENS = 1024
+
+
+def read_rss(field: str = "VmRSS") -> Optional[int]:
+    """Resident memory of this process in bytes; VmHWM is the peak since it was last reset"""
+    try:
+        with open(STATUS_PATH) as f:
+            for line in f:
+                if line.startswith(f"{field}:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+def reset_peak_rss() -> bool:
+    """Reset VmHWM to the current RSS; False where the kernel does not allow it"""
+    try:
+        with open(CLEAR_REFS_PATH, "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def is_out_of_memory(error: BaseException) -> bool:
+    """Whether an exception raised by the model is a failed tensor allocation"""
+    if isinstance(error, MemoryError):
+        return True
+    message = str(error).lower()
+    # DefaultCPUAllocator: can't allocate memory / CUDA out of memory
+    return isinstance(error, RuntimeError) and ("allocate memory" in message or "out of memory" in message)
+
+
+class PeakRss:
+    """Highest resident memory of the process seen while one request was in flight"""
+
+    def __init__(self):
+        self.peak_bytes = None
+
+    def update(self, value: Optional[int]):
+        if value is not None and (self.peak_bytes is None or value > self.peak_bytes):
+            self.peak_bytes = value
+
+    @property
+    def peak_mb(self) -> Optional[float]:
+        return round(self.peak_bytes / (1024 * 1024), 1) if self.peak_bytes is not None else None
+
+
+class Reservation:
+    """Estimated memory held by one model batch while it runs"""
+
+    def __init__(self, tokens: int, estimate: float):
+        self.tokens = tokens
+        self.estimate = estimate
+        # Whether another batch ran at the same time, which makes its RSS growth unattributable
+        self.overlapped = False
+        self.base_rss = None
+
+
+class MemoryBudget:
+    """Keep the activation memory of concurrent model batches within a byte budget.
+
+    A batch is assumed to cost bytes_per_token for every token of its padded
+    input, once per decoded candidate. Batches are planned from inputs sorted
+    by token length, so each is padded only to the length of inputs like it,
+    and sized so their estimate fits the budget. Before running, a batch
+    reserves its estimate and waits while batches already running hold too
+    much of the budget; a batch that alone exceeds the budget runs by itself.
+    bytes_per_token is raised when a batch that ran alone grows the peak RSS
+    by more than its estimate, and never lowered. After a failed allocation,
+    tokens per batch are capped at half the size that failed and the
+    remaining batches are planned again. The cap doubles after every
+    recover_batches batches of at least half its size succeed, and is lifted
+    once it is back at the size that failed, so a transient failure does not
+    throttle the worker for good. With a budget of 0 only that cap applies.
+    """
+
+    def __init__(self, budget_bytes: int, bytes_per_token: float, recover_batches: int = 32):
+        self.budget_bytes = budget_bytes
+        self.bytes_per_token = bytes_per_token
+        # Tokens per batch, capped after an allocation failure
+        self.max_tokens = None
+        self.recover_batches = recover_batches
+        # Size of the batch whose allocation failed, and batches near the cap that have succeeded since
+        self._failed_tokens = None
+        self._clean_batches = 0
+        self._cond = threading.Condition()
+        self._reserved = 0.0
+        self._running: List[Reservation] = []
+        self._trackers = set()
+        self._resettable = reset_peak_rss()
+        self._stats = {"batches": 0, "waited": 0, "samples": 0, "out_of_memory": 0, "cap_raised": 0}
+
+    def token_limit(self) -> Optional[int]:
+        """Padded tokens (times candidates) allowed in one batch, or None when unlimited"""
+        limits = [self.max_tokens] if self.max_tokens is not None else []
+        if self.budget_bytes > 0:
+            limits.append(int(self.budget_bytes / self.bytes_per_token))
+        return max(1, min(limits)) if limits else None
+
+    def plan_batches(self, lengths: List[int], copies: int, max_rows: int) -> List[List[int]]:
+        """Group input indices into batches of similar length within max_rows decoder rows and the token limit"""
+        limit = self.token_limit()
+        batches = []
+        batch = []
+        # Ascending length, so the input being added is always the longest of its batch
+        for index in sorted(range(len(lengths)), key=lambda i: lengths[i]):
+            rows = (len(batch) + 1) * copies
+            if batch and (rows > max_rows or (limit is not None and rows * lengths[index] > limit)):
+                batches.append(batch)
+                batch = []
+            batch.append(index)
+        if batch:
+            batches.append(batch)
+        return batches
+
+    @contextmanager
+    def reserve(self, tokens: int):
+        """Hold a batch's estimated memory while it runs, waiting for room in the budget first"""
+        reservation = Reservation(tokens, tokens * self.bytes_per_token)
+        with self._cond:
+            if self.budget_bytes > 0 and self._running and self._reserved + reservation.estimate > self.budget_bytes:
+                self._stats["waited"] += 1
+                while self._running and self._reserved + reservation.estimate > self.budget_bytes:
+                    self._cond.wait()
+            if self._running:
+                reservation.overlapped = True
+                for other in self._running:
+                    other.overlapped = True
+            else:
+                # Resets the peak so this batch's own growth can be measured
+                self._sample()
+                reservation.base_rss = read_rss()
+            self._running.append(reservation)
+            self._reserved += reservation.estimate
+            self._stats["batches"] += 1
+            MEMORY_RESERVED.set(self._reserved)
+
+        completed = False
+        try:
+            yield reservation
+            completed = True
+        finally:
+            with self._cond:
+                if completed:
+                    self._learn(reservation)
+                    self._recover(reservation)
+                self._running.remove(reservation)
+                self._reserved -= reservation.estimate
+                self._sample()
+                MEMORY_RESERVED.set(self._reserved)
+                self._cond.notify_all()
+
+    def record_out_of_memory(self, tokens: int):
+        """Cap batches below a size whose allocation failed"""
+        with self._cond:
+            self._stats["out_of_memory"] += 1
+            self.max_tokens = max(1, min(self.max_tokens or tokens, tokens // 2))
+            self._failed_tokens = tokens
+            self._clean_batches = 0
+
+    @contextmanager
+    def track(self):
+        """Record the peak RSS of the process while a request is in flight"""
+        usage = PeakRss()
+        with self._cond:
+            self._sample()
+            usage.update(self._current_peak())
+            self._trackers.add(usage)
+        try:
+            yield usage
+        finally:
+            with self._cond:
+                self._sample()
+                self._trackers.discard(usage)
+
+    def _current_peak(self) -> Optional[int]:
+        return read_rss("VmHWM" if self._resettable else "VmRSS")
+
+    def _sample(self):
+        """Credit the peak since the last reset to the tracked requests; the caller holds the lock"""
+        peak = self._current_peak()
+        for usage in self._trackers:
+            usage.update(peak)
+        # A reset while a batch runs would hide part of its peak
+        if self._resettable and not self._running:
+            reset_peak_rss()
+
+    def _learn(self, reservation: Reservation):
+        """Raise bytes_per_token when a batch that ran alone grew RSS by more than estimated; the caller holds the lock"""
+        if not self._resettable or reservation.overlapped or reservation.tokens < MIN_SAMPLE_TOKENS:
+            return
+        peak = read_rss("VmHWM")
+        if peak is None or reservation.base_rss is None:
+            return
+        sample = max(0, peak - reservation.base_rss) / reservation.tokens
+        self._stats["samples"] += 1
+        # Never lowered: once the allocator reuses freed pages, RSS growth understates what a batch needs
+        self.bytes_per_token = max(self.bytes_per_token, sample)
+
+    def _recover(self, reservation: Reservation):
+        """Double the cap after enough batches near it succeed, lifting it at the size that failed; the caller holds the lock"""
+        # Batches well below the cap say nothing about whether a larger one would fit
+        if self.max_tokens is None or reservation.tokens * 2 < self.max_tokens:
+            return
+        self._clean_batches += 1
+        if self._clean_batches < self.recover_batches:
+            return
+        self._clean_batches = 0
+        self._stats["cap_raised"] += 1
+        self.max_tokens *= 2
+        if self.max_tokens >= self._failed_tokens:
+            self.max_tokens = None
+
+    def stats(self) -> Dict:
+        """Budget, current reservations, learned cost and resident memory"""
+        with self._cond:
+            return {
+                "budget_mb": round(self.budget_bytes / (1024 * 1024), 1),
+                "bytes_per_token": round(self.bytes_per_token),
+                "token_limit": self.token_limit(),
+                "reserved_mb": round(self._reserved / (1024 * 1024), 1),
+                "running_batches": len(self._running),
+                "rss_mb": round((read_rss() or 0) / (1024 * 1024), 1),
+                **self._stats
+            }
@@ -0,0 +1,64 @@
+from prometheus_client import Counter, Gauge, Histogram
+
+LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+STAGE_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+
+REQUEST_LATENCY = Histogram(
+    "qg_request_latency_seconds", "Time to produce a response, by endpoint",
+    ["endpoint"], buckets=LATENCY_BUCKETS
+)
+REQUESTS_IN_FLIGHT = Gauge(
+    "qg_requests_in_flight", "Requests currently being handled, by endpoint", ["endpoint"],
+    multiprocess_mode="livesum"
+)
+ERRORS = Counter(
+    "qg_errors_total", "Failed requests, by endpoint and error type", ["endpoint", "error_type"]
+)
+
+QUEUE_WAIT = Histogram(
+    "qg_queue_wait_seconds", "Time an encoder input waited in the micro-batch queue", buckets=STAGE_BUCKETS
+)
+BATCH_SIZE = Histogram(
+    "qg_batch_size", "Encoder inputs per model batch", buckets=(1, 2, 4, 8, 16, 32, 64)
+)
+TOKENIZE_SECONDS = Histogram(
+    "qg_tokenize_seconds", "Tokenization time per generate call", buckets=STAGE_BUCKETS
+)
+GENERATE_SECONDS = Histogram(
+    "qg_generate_seconds", "model.generate time per model batch", buckets=STAGE_BUCKETS
+)
+DECODE_SECONDS = Histogram(
+    "qg_decode_seconds", "Detokenization time per model batch", buckets=STAGE_BUCKETS
+)
+COALESCED_REQUESTS = Counter(
+    "qg_coalesced_requests_total", "Requests served by joining an identical in-flight generation"
+)
+ADMISSION_QUEUE_DEPTH = Gauge(
+    "qg_admission_queue_depth", "Requests waiting for a generation slot, by priority class", ["priority"],
+    multiprocess_mode="livesum"
+)
+ADMISSION_ACTIVE = Gauge(
+    "qg_admission_active", "Requests holding a generation slot, by priority class", ["priority"],
+    multiprocess_mode="livesum"
+)
+ADMISSION_WAIT = Histogram(
+    "qg_admission_wait_seconds", "Time a request waited for a generation slot, by priority class",
+    ["priority"], buckets=LATENCY_BUCKETS
+)
+ADMISSION_REJECTED = Counter(
+    "qg_admission_rejected_total", "Requests turned away by admission control, by priority class and reason",
+    ["priority", "reason"]
+)
+MEMORY_RESERVED = Gauge(
+    "qg_memory_reserved_bytes", "Estimated activation memory of the model batches in flight", multiprocess_mode="livesum"
+)
+OOM_RETRIES = Counter(
+    "qg_oom_retries_total", "Model batches split in half and retried after a failed allocation"
+)
+PADDING_RATIO = Histogram(
+    "qg_batch_padding_ratio", "Share of padding tokens in each model batch", buckets=(0.01, 0.05, 0.1, 0.2, 0.3, 0.5, 0.75)
+)
+REQUEST_PEAK_RSS = Histogram(
+    "qg_request_peak_rss_bytes", "Peak resident memory of the worker while a request was in flight, by endpoint",
+    ["endpoint"], buckets=tuple(mb * 1024 * 1024 for mb in (256, 512, 1024, 1536, 2048, 3072, 4096, 8192))
+)
@@ -0,0 +1,93 @@
+import gc
+import logging
+import os
+import signal
+import socket
+import time
+from typing import Callable, Dict, List, Optional
+
+from werkzeug.serving import make_server
+
+
+def core_slices(workers: int) -> List[List[int]]:
+    """Split the CPUs available to this process into one contiguous slice per worker"""
+    cores = sorted(os.sched_getaffinity(0))
+    per_worker = max(1, len(cores) // workers)
+    return [cores[(i * per_worker) % len(cores):][:per_worker] for i in range(workers)]
+
+
+def serve_prefork(app, host: str, port: int, workers: int, on_worker_start: Callable[[List[int]], None],
+                  on_worker_exit: Optional[Callable[[int], None]] = None):
+    """Serve a WSGI app from N forked worker processes sharing one listening socket.
+
+    Everything loaded before this call (in particular model weights) is
+    inherited copy-on-write by every worker. Each worker is pinned to its own
+    slice of cores and calls on_worker_start(cores) to set up per-process
+    state (threads, database connections) before accepting requests. The
+    kernel spreads incoming connections across the workers' accept() calls.
+    Workers that exit unexpectedly are restarted; on_worker_exit(pid) is
+    called in the parent whenever a worker exits.
+    """
+    listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    listener.bind((host, port))
+    listener.listen(1024)
+    listener.set_inheritable(True)
+
+    # Move everything allocated so far out of the GC's reach so collections in
+    # the workers do not touch, and thereby copy, the shared pages
+    gc.collect()
+    gc.freeze()
+
+    slices = core_slices(workers)
+    children: Dict[int, int] = {}  # pid -> worker index
+
+    def spawn(index: int):
+        pid = os.fork()
+        if pid == 0:
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            try:
+                os.sched_setaffinity(0, slices[index])
+                on_worker_start(slices[index])
+                logging.info(f"Worker {index} (pid {os.getpid()}) serving on cores {slices[index]}")
+                server = make_server(host, port, app, threaded=True, fd=listener.fileno())
+                server.serve_forever()
+            except Exception as e:
+                logging.error(f"Worker {index} failed: {e}")
+            finally:
+                os._exit(1)
+        children[pid] = index
+
+    for index in range(workers):
+        spawn(index)
+    logging.info(f"Serving on http://{host}:{port} with {workers} worker processes")
+
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in list(children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        index = children.pop(pid, None)
+        if on_worker_exit is not None:
+            on_worker_exit(pid)
+        if index is not None and not stopping:
+            logging.warning(f"Worker {index} (pid {pid}) exited with status {status}, restarting")
+            time.sleep(1)
+            spawn(index)
+
+    listener.close()
@@ -0,0 +1,102 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from typing import Dict, Optional
+
+
+class QuestionCache:
+    """Persistent, content-addressed cache of generated questions.
+
+    Entries are keyed by a hash of a preprocessed chunk together with the
+    model name and generation parameters, and map each answer extracted from
+    that chunk to the question generated for it. The store is a local SQLite
+    file that pre-forked workers share; its total size in encoded bytes is
+    kept in the file itself, updated in the same transaction as each write,
+    and once it grows past max_bytes the least recently used entries are
+    evicted.
+    """
+
+    def __init__(self, path: str, max_bytes: int = 256 * 1024 * 1024):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS questions ("
+            "key TEXT PRIMARY KEY, "
+            "answers TEXT NOT NULL, "
+            "size INTEGER NOT NULL, "
+            "last_access REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS questions_last_access ON questions (last_access)")
+        # Single-row running total, so a write need not sum the whole table
+        self._conn.execute("CREATE TABLE IF NOT EXISTS totals (id INTEGER PRIMARY KEY CHECK (id = 0), bytes INTEGER NOT NULL)")
+        self._conn.execute("INSERT OR IGNORE INTO totals (id, bytes) SELECT 0, COALESCE(SUM(size), 0) FROM questions")
+        self._conn.commit()
+        self._counters = {"hits": 0, "misses": 0, "evictions": 0}
+
+    @staticmethod
+    def make_key(chunk: str, model_name: str, params: Dict) -> str:
+        """Hash a chunk with the model and generation parameters that produced its questions"""
+        material = json.dumps({"chunk": chunk, "model": model_name, "params": params}, sort_keys=True)
+        return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[Dict[str, str]]:
+        """Return the answer -> question mapping stored for a chunk, or None"""
+        with self._lock:
+            row = self._conn.execute("SELECT answers FROM questions WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self._counters["misses"] += 1
+                return None
+
+            self._conn.execute("UPDATE questions SET last_access = ? WHERE key = ?", (time.time(), key))
+            self._conn.commit()
+            self._counters["hits"] += 1
+            return json.loads(row[0])
+
+    def put(self, key: str, answers: Dict[str, str]):
+        """Store the answer -> question mapping for a chunk and evict if over budget"""
+        value = json.dumps(answers)
+        size = len(key.encode("utf-8")) + len(value.encode("utf-8"))
+
+        with self._lock, self._conn:
+            # Take the write lock first so workers sharing the file update the total one at a time
+            self._conn.execute("BEGIN IMMEDIATE")
+            row = self._conn.execute("SELECT size FROM questions WHERE key = ?", (key,)).fetchone()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO questions (key, answers, size, last_access) VALUES (?, ?, ?, ?)",
+                (key, value, size, time.time())
+            )
+            self._conn.execute("UPDATE totals SET bytes = bytes + ? WHERE id = 0", (size - (row[0] if row else 0),))
+
+            total = self._total_bytes()
+            if total > self.max_bytes:
+                self._evict(total)
+
+    def _total_bytes(self) -> int:
+        return self._conn.execute("SELECT bytes FROM totals WHERE id = 0").fetchone()[0]
+
+    def _evict(self, total: int):
+        """Drop least recently used entries until the store is back under max_bytes; runs inside put's transaction"""
+        rows = self._conn.execute("SELECT key, size FROM questions ORDER BY last_access ASC")
+        stale = []
+        freed = 0
+        for key, size in rows:
+            if total - freed <= self.max_bytes:
+                break
+            stale.append((key,))
+            freed += size
+
+        self._conn.executemany("DELETE FROM questions WHERE key = ?", stale)
+        self._conn.execute("UPDATE totals SET bytes = bytes - ? WHERE id = 0", (freed,))
+        self._counters["evictions"] += len(stale)
+
+    def stats(self) -> Dict:
+        """Return hit/miss/eviction counters and current occupancy"""
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM questions").fetchone()[0]
+            return dict(self._counters, entries=entries, bytes=self._total_bytes(), max_bytes=self.max_bytes)
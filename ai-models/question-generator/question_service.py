@@ -1,196 +1,194 @@
-from flask import Flask, request, jsonify
-import torch
-from transformers import AutoTokenizer, AutoModelForSeq2SeqLM
+from flask import Flask, Response, g, request, jsonify, stream_with_context
+import argparse
 import logging
 import json
-import re
-from typing import List, Dict
+import os
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Dict, Iterator, List, Optional
+import torch
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, REGISTRY, generate_latest, multiprocess
+# The service runs as a script from question-generator/; ai-models/ above it holds the shared common package
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.admission import BATCH, INTERACTIVE, PRIORITIES, AdmissionController, Overloaded, queue_classes_from_env
+import metrics as service_metrics
+from batch_scheduler import MicroBatchScheduler
+from metrics import ERRORS, REQUEST_LATENCY, REQUEST_PEAK_RSS, REQUESTS_IN_FLIGHT
+from prefork import serve_prefork
+from question_cache import QuestionCache
+from t5_question_generator import T5QuestionGenerator
 
 app = Flask(__name__)
 logging.basicConfig(level=logging.INFO)
 
-class T5QuestionGenerator:
-    def __init__(self):
-        self.model_name = "iarfmoose/t5-base-question-generator"
-        self.tokenizer = None
-        self.model = None
-        self.device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-        self.load_model()
-    
-    def load_model(self):
-        """Load the T5 question generation model"""
-        try:
-            logging.info("Loading T5 question generation model...")
-            self.tokenizer = AutoTokenizer.from_pretrained(self.model_name)
-            self.model = AutoModelForSeq2SeqLM.from_pretrained(self.model_name)
-            self.model.to(self.device)
-            self.model.eval()
-            logging.info("Model loaded successfully!")
-        except Exception as e:
-            logging.error(f"Error loading model: {e}")
-            raise e
-    
-    def preprocess_text(self, text: str, max_length: int = 512) -> List[str]:
-        """Split text into chunks suitable for processing"""
-        sentences = re.split(r'[.!?]+', text)
-        chunks = []
-        current_chunk = ""
-        
-        for sentence in sentences:
-            sentence = sentence.strip()
-            if not sentence:
-                continue
-                
-            if len(current_chunk + sentence) < max_length:
-                current_chunk += sentence + ". "
-            else:
-                if current_chunk:
-                    chunks.append(current_chunk.strip())
-                current_chunk = sentence + ". "
-        
-        if current_chunk:
-            chunks.append(current_chunk.strip())
-        
-        return chunks[:5]  # Limit to 5 chunks for performance
-    
-    def generate_questions_from_text(self, context: str, max_questions: int = 10) -> List[Dict]:
-        """Generate questions from context text"""
-        try:
-            chunks = self.preprocess_text(context)
-            all_questions = []
-            
-            for chunk in chunks:
-                # Extract potential answers (important nouns, concepts)
-                answers = self.extract_key_concepts(chunk)
-                
-                for answer in answers[:3]:  # Max 3 answers per chunk
-                    if len(all_questions) >= max_questions:
-                        break
-                    
-                    input_text = f"answer: {answer} context: {chunk}"
-                    
-                    # Tokenize and generate
-                    inputs = self.tokenizer.encode(
-                        input_text,
-                        return_tensors="pt",
-                        max_length=512,
-                        truncation=True
-                    ).to(self.device)
-                    
-                    with torch.no_grad():
-                        outputs = self.model.generate(
-                            inputs,
-                            max_length=64,
-                            num_return_sequences=1,
-                            temperature=0.7,
-                            do_sample=True,
-                            pad_token_id=self.tokenizer.pad_token_id,
-                            eos_token_id=self.tokenizer.eos_token_id
-                        )
-                    
-                    question = self.tokenizer.decode(outputs[0], skip_special_tokens=True)
-                    
-                    # Generate multiple choice options
-                    options = self.generate_mcq_options(answer, chunk)
-                    
-                    question_obj = {
-                        "id": f"q_{len(all_questions) + 1}_{hash(question) % 1000}",
-                        "question": question,
-                        "type": "multiple_choice",
-                        "options": options,
-                        "correct_answer": answer,
-                        "explanation": f"This question tests understanding of {answer} in the given context.",
-                        "difficulty": self.assess_difficulty(question, chunk),
-                        "topic": self.extract_topic(chunk)
-                    }
-                    
-                    all_questions.append(question_obj)
-                
-                if len(all_questions) >= max_questions:
-                    break
-            
-            return all_questions
-            
-        except Exception as e:
-            logging.error(f"Error generating questions: {e}")
-            return []
-    
-    def extract_key_concepts(self, text: str) -> List[str]:
-        """Extract key concepts that can serve as answers"""
-        # Simple extraction - in production, you might use NER or more sophisticated methods
-        words = re.findall(r'\b[A-Z][a-z]+\b|\b[a-z]{4,}\b', text)
-        
-        # Filter out common words
-        stop_words = {'this', 'that', 'with', 'have', 'will', 'from', 'they', 'been', 'were', 'said', 'each', 'which', 'their', 'time', 'more', 'very', 'when', 'come', 'here', 'there', 'could', 'other'}
-        
-        concepts = [word for word in words if word.lower() not in stop_words and len(word) > 3]
-        
-        # Remove duplicates while preserving order
-        seen = set()
-        unique_concepts = []
-        for concept in concepts:
-            if concept.lower() not in seen:
-                seen.add(concept.lower())
-                unique_concepts.append(concept)
-        
-        return unique_concepts[:10]  # Return top 10 concepts
-    
-    def generate_mcq_options(self, correct_answer: str, context: str) -> List[str]:
-        """Generate plausible multiple choice options"""
-        # Extract other concepts from context as distractors
-        concepts = self.extract_key_concepts(context)
-        options = [correct_answer]
-        
-        # Add distractors
-        for concept in concepts:
-            if concept.lower() != correct_answer.lower() and len(options) < 4:
-                options.append(concept)
-        
-        # Fill remaining slots with generic distractors if needed
-        generic_distractors = ["None of the above", "All of the above", "Cannot be determined", "Insufficient information"]
-        
-        while len(options) < 4:
-            for distractor in generic_distractors:
-                if distractor not in options and len(options) < 4:
-                    options.append(distractor)
-                    break
-        
-        return options
-    
-    def assess_difficulty(self, question: str, context: str) -> str:
-        """Assess question difficulty based on various factors"""
-        question_length = len(question.split())
-        context_complexity = len(context.split())
-        
-        if question_length > 15 or context_complexity > 200:
-            return "hard"
-        elif question_length > 10 or context_complexity > 100:
-            return "medium"
-        else:
-            return "easy"
+# Number of pre-forked worker processes; 1 serves from this process with app.run
+workers = int(os.environ.get("QG_WORKERS", 1))
+
+# Initialize the question generator; the model loads in the background unless QG_EAGER_LOAD=1.
+# With several workers the parent loads it up front, single-threaded, so the forked workers
+# share its weights copy-on-write and inherit no OpenMP thread pool.
+eager_load = os.environ.get("QG_EAGER_LOAD", "0") == "1" or workers > 1
+question_generator = T5QuestionGenerator(load=False, num_threads=1 if workers > 1 else None)
+
+# Upper bound for the num_candidates request parameter
+MAX_CANDIDATES = 8
+
+# Contexts of a batch request run concurrently so their inputs share micro-batches
+max_batch_contexts = int(os.environ.get("QG_MAX_BATCH_CONTEXTS", 100))
+context_executor = ThreadPoolExecutor(
+    max_workers=int(os.environ.get("QG_CONTEXT_WORKERS", 16)),
+    thread_name_prefix="batch-context"
+)
+
+# Interactive and batch requests queue separately for a bounded number of concurrent generations per worker.
+# A slot covers the model work of one context, so a batch request takes one per context it generates.
+max_concurrent = int(os.environ.get("QG_MAX_CONCURRENT", 16))
+queue_classes = queue_classes_from_env(
+    "QG", max_concurrent,
+    batch_limit=max(1, max_concurrent // 2),
+    interactive_queue=64,
+    batch_queue=32,
+    interactive_deadline=30,
+    batch_deadline=600
+)
+# Starting point for cost estimates; refined from the durations of finished requests
+admission = AdmissionController(max_concurrent, queue_classes, float(os.environ.get("QG_SECONDS_PER_QUESTION", 0.5)), service_metrics)
+question_generator.admission = admission
+
+def init_process_resources():
+    """Create the threads and connections that cannot be shared across a fork"""
+    # Pool encoder inputs from concurrent requests into shared batches
+    if os.environ.get("QG_MICRO_BATCHING", "1") != "0":
+        question_generator.scheduler = MicroBatchScheduler(
+            question_generator.generate_question_candidates,
+            max_batch_size=question_generator.max_batch_size,
+            max_wait_ms=float(os.environ.get("QG_MAX_WAIT_MS", 5)),
+            weights={queue_class.name: queue_class.weight for queue_class in queue_classes}
+        )
+        question_generator.scheduler.start()
     
-    def extract_topic(self, text: str) -> str:
-        """Extract the main topic from text"""
-        # Simple topic extraction - could be enhanced with NLP libraries
-        words = text.split()
-        if len(words) > 0:
-            # Look for capitalized words or longer words as potential topics
-            for word in words:
-                if word.istitle() and len(word) > 4:
-                    return word
-        
-        return "General"
+    # Reuse questions for chunks that earlier requests already processed. The store defaults to the
+    # system temp directory rather than whatever directory the service happens to be started from.
+    question_cache_path = os.environ.get("QG_CACHE_PATH", os.path.join(tempfile.gettempdir(), "qg_question_cache.sqlite3"))
+    if question_cache_path:
+        question_generator.question_cache = QuestionCache(
+            question_cache_path,
+            max_bytes=int(os.environ.get("QG_CACHE_MAX_MB", 256)) * 1024 * 1024
+        )
 
-# Initialize the question generator
-question_generator = T5QuestionGenerator()
+def init_worker(cores: List[int]):
+    """Set up a pre-forked worker pinned to the given cores"""
+    torch.set_num_threads(len(cores))
+    init_process_resources()
+
+def mark_worker_dead(pid: int):
+    """Drop a dead worker's live gauges from the shared metrics directory"""
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        multiprocess.mark_process_dead(pid)
+
+if eager_load:
+    question_generator.load_model()
+else:
+    question_generator.start_background_load()
+
+if workers == 1:
+    init_process_resources()
+
+def model_not_ready():
+    """Return a 503 response while the model is still loading or failed to load, else None"""
+    if question_generator.ready:
+        return None
+    return jsonify({
+        "error": f"Model is not ready (state: {question_generator.state})",
+        "model_state": question_generator.state
+    }), 503
+
+def request_priority(data: Dict, default: str) -> str:
+    """The request's priority field, or the endpoint's default class"""
+    priority = data.get('priority', default)
+    if priority not in PRIORITIES:
+        raise ValueError(f"priority must be one of: {', '.join(PRIORITIES)}")
+    return priority
+
+def overloaded_response(error: Overloaded):
+    """JSON error for a request turned away by admission control, with a Retry-After hint"""
+    g.error_type = "overloaded"
+    return jsonify({"error": error.message}), error.status, {"Retry-After": str(error.retry_after)}
+
+@contextmanager
+def measure_peak_rss():
+    """Track the worker's peak resident memory while the current request is in flight"""
+    endpoint = request.endpoint
+    with question_generator.memory.track() as usage:
+        yield usage
+    if usage.peak_bytes is not None:
+        REQUEST_PEAK_RSS.labels(endpoint).observe(usage.peak_bytes)
+
+@app.before_request
+def start_request_metrics():
+    if request.endpoint and request.endpoint != 'metrics':
+        g.metrics_started = time.perf_counter()
+        REQUESTS_IN_FLIGHT.labels(request.endpoint).inc()
+
+@app.after_request
+def record_request_metrics(response):
+    # Streaming responses are timed to their first byte; the body is produced after this hook
+    if 'metrics_started' in g:
+        REQUEST_LATENCY.labels(request.endpoint).observe(time.perf_counter() - g.metrics_started)
+        if response.status_code >= 400:
+            ERRORS.labels(request.endpoint, g.get('error_type', f"http_{response.status_code}")).inc()
+    return response
+
+@app.teardown_request
+def finish_request_metrics(exc):
+    # Runs a second time when a streamed body finishes under stream_with_context
+    if g.pop('metrics_started', None) is not None:
+        REQUESTS_IN_FLIGHT.labels(request.endpoint).dec()
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Prometheus metrics; aggregated across workers when PROMETHEUS_MULTIPROC_DIR is set"""
+    registry = REGISTRY
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    return Response(generate_latest(registry), mimetype=CONTENT_TYPE_LATEST)
 
 @app.route('/health', methods=['GET'])
 def health_check():
-    return jsonify({"status": "healthy", "model_loaded": question_generator.model is not None})
+    scheduler = question_generator.scheduler
+    status = {"ready": "healthy", "failed": "unhealthy"}.get(question_generator.state, "loading")
+    return jsonify({
+        "status": status,
+        "model_loaded": question_generator.ready,
+        "model_state": question_generator.state,
+        "model_error": question_generator.load_error,
+        "load_metrics": question_generator.load_metrics,
+        "batching": scheduler.stats() if scheduler is not None else None,
+        "cache": question_generator.question_cache.stats() if question_generator.question_cache is not None else None,
+        "coalescing": question_generator.single_flight.stats() if question_generator.single_flight is not None else None,
+        "admission": admission.stats(),
+        "memory": question_generator.memory.stats()
+    })
+
+@app.route('/ready', methods=['GET'])
+def readiness_check():
+    """Readiness probe: 200 once the model is loaded, 503 until then"""
+    not_ready = model_not_ready()
+    if not_ready:
+        return not_ready
+    return jsonify({"status": "ready"})
 
 @app.route('/generate-questions', methods=['POST'])
 def generate_questions():
     try:
+        not_ready = model_not_ready()
+        if not_ready:
+            return not_ready
+        
         data = request.get_json()
         
         if not data or 'context' not in data:
@@ -206,8 +204,20 @@ def generate_questions():
         if max_questions > 20:
             return jsonify({"error": "Maximum 20 questions allowed per request"}), 400
         
-        # Generate questions
-        questions = question_generator.generate_questions_from_text(context, max_questions)
+        # Candidates decoded per question: higher trades latency for quality and diversity
+        num_candidates = data.get('num_candidates', 1)
+        if not isinstance(num_candidates, int) or not 1 <= num_candidates <= MAX_CANDIDATES:
+            return jsonify({"error": f"num_candidates must be between 1 and {MAX_CANDIDATES}"}), 400
+        
+        # Quiz requests from the app are interactive; bulk callers should send "priority": "batch"
+        try:
+            priority = request_priority(data, INTERACTIVE)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        
+        # Generate questions; the model work on cache misses waits for an admission slot
+        with measure_peak_rss() as memory_usage:
+            questions = question_generator.generate_questions_from_text(context, max_questions, num_candidates, priority)
         
         if not questions:
             return jsonify({"error": "Failed to generate questions from the provided context"}), 500
@@ -216,17 +226,93 @@ def generate_questions():
             "success": True,
             "questions": questions,
             "total_generated": len(questions),
-            "context_length": len(context)
+            "context_length": len(context),
+            "peak_rss_mb": memory_usage.peak_mb
         })
         
+    except Overloaded as e:
+        return overloaded_response(e)
     except Exception as e:
         logging.error(f"Error in generate_questions endpoint: {e}")
+        g.error_type = type(e).__name__
         return jsonify({"error": "Internal server error"}), 500
 
+def generate_for_context(index: int, context: str, max_questions: int, num_candidates: int = 1,
+                         priority: str = BATCH) -> List[Dict]:
+    """Generate questions for one context of a batch, tagged with its index"""
+    if not context.strip():
+        return []
+    
+    questions = question_generator.generate_questions_from_text(context, max_questions, num_candidates, priority)
+    
+    # Add context index to each question
+    for question in questions:
+        question['context_index'] = index
+        question['id'] = f"batch_{index}_{question['id']}"
+    
+    return questions
+
+def context_result(index: int, future: Future) -> Dict:
+    """Result line of a finished context; a context that is turned away or fails does not end the batch"""
+    try:
+        return {"context_index": index, "success": True, "questions": future.result()}
+    except Overloaded as e:
+        return {"context_index": index, "success": False, "error": e.message, "retry_after": e.retry_after}
+    except Exception as e:
+        logging.error(f"Error generating questions for context {index}: {e}")
+        return {"context_index": index, "success": False, "error": "Internal server error"}
+
+def iter_context_results(contexts: List[str], max_questions: int, timeout: Optional[float],
+                         num_candidates: int = 1, priority: str = BATCH) -> Iterator[Dict]:
+    """Fan contexts out to the executor and yield each result as soon as it finishes
+
+    timeout applies to each context from when it starts running, so contexts
+    still queued behind others are not charged for their wait. A context that
+    overruns is reported as timed out but keeps its admission slot until its
+    generation actually ends. Contexts that have not started when the
+    iterator is closed, e.g. by a client disconnecting, are cancelled.
+    """
+    started = {}
+    
+    def run(index: int, context: str) -> List[Dict]:
+        started[index] = time.monotonic()
+        return generate_for_context(index, context, max_questions, num_candidates, priority)
+    
+    futures = {context_executor.submit(run, i, context): i for i, context in enumerate(contexts)}
+    pending = set(futures)
+    try:
+        while pending:
+            wait_for = None
+            if timeout is not None:
+                # Wake for the earliest deadline of a running context, and now and then to see new ones start
+                now = time.monotonic()
+                deadlines = [started[futures[f]] + timeout for f in pending if futures[f] in started]
+                wait_for = max(0.0, min(deadlines + [now + 0.5]) - now)
+            
+            done, _ = wait(pending, timeout=wait_for, return_when=FIRST_COMPLETED)
+            for future in sorted(done, key=futures.get):
+                pending.discard(future)
+                yield context_result(futures[future], future)
+            
+            if timeout is not None:
+                now = time.monotonic()
+                overrun = [f for f in pending if futures[f] in started and now - started[futures[f]] >= timeout]
+                for future in sorted(overrun, key=futures.get):
+                    pending.discard(future)
+                    yield {"context_index": futures[future], "success": False, "timed_out": True,
+                           "error": f"Timed out after {timeout}s"}
+    finally:
+        for future in pending:
+            future.cancel()
+
 @app.route('/generate-batch-questions', methods=['POST'])
 def generate_batch_questions():
     """Generate questions from multiple contexts"""
     try:
+        not_ready = model_not_ready()
+        if not_ready:
+            return not_ready
+        
         data = request.get_json()
         
         if not data or 'contexts' not in data:
@@ -238,35 +324,155 @@ def generate_batch_questions():
         if not isinstance(contexts, list) or len(contexts) == 0:
             return jsonify({"error": "Contexts must be a non-empty list"}), 400
         
-        if len(contexts) > 10:
-            return jsonify({"error": "Maximum 10 contexts allowed per batch"}), 400
+        if len(contexts) > max_batch_contexts:
+            return jsonify({"error": f"Maximum {max_batch_contexts} contexts allowed per batch"}), 400
         
-        all_questions = []
+        if not all(isinstance(context, str) for context in contexts):
+            return jsonify({"error": "Every context must be a string"}), 400
         
-        for i, context in enumerate(contexts):
-            if context.strip():
-                questions = question_generator.generate_questions_from_text(
-                    context, max_questions_per_context
-                )
-                
-                # Add context index to each question
-                for question in questions:
-                    question['context_index'] = i
-                    question['id'] = f"batch_{i}_{question['id']}"
-                
-                all_questions.extend(questions)
+        # Optional per-context deadline in seconds, measured from when the context starts generating
+        context_timeout = data.get('context_timeout')
+        if context_timeout is not None and (type(context_timeout) not in (int, float) or context_timeout <= 0):
+            return jsonify({"error": "context_timeout must be a positive number of seconds"}), 400
         
-        return jsonify({
+        num_candidates = data.get('num_candidates', 1)
+        if not isinstance(num_candidates, int) or not 1 <= num_candidates <= MAX_CANDIDATES:
+            return jsonify({"error": f"num_candidates must be between 1 and {MAX_CANDIDATES}"}), 400
+        
+        # Bulk quiz and flashcard generation defaults to the batch class
+        try:
+            priority = request_priority(data, BATCH)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        # Turn the batch away up front when its class is saturated; each context then takes its own slot
+        admission.check(priority)
+        
+        results = iter_context_results(contexts, max_questions_per_context, context_timeout, num_candidates, priority)
+        
+        if data.get('stream', False):
+            # One NDJSON line per context as it completes, then a summary line
+            def stream_results():
+                started = time.monotonic()
+                total_generated = 0
+                with measure_peak_rss() as memory_usage:
+                    for result in results:
+                        if result["success"]:
+                            result["total_generated"] = len(result["questions"])
+                            total_generated += result["total_generated"]
+                        yield json.dumps(result) + "\n"
+                yield json.dumps({
+                    "done": True,
+                    "total_generated": total_generated,
+                    "contexts_processed": len(contexts),
+                    "elapsed_seconds": round(time.monotonic() - started, 3),
+                    "peak_rss_mb": memory_usage.peak_mb
+                }) + "\n"
+            
+            return Response(stream_with_context(stream_results()), mimetype="application/x-ndjson")
+        
+        questions_by_context = {}
+        timed_out = []
+        rejected = []
+        failed = []
+        with measure_peak_rss() as memory_usage:
+            for result in results:
+                if result["success"]:
+                    questions_by_context[result["context_index"]] = result["questions"]
+                elif "retry_after" in result:
+                    rejected.append(result["context_index"])
+                elif result.get("timed_out"):
+                    timed_out.append(result["context_index"])
+                else:
+                    failed.append(result["context_index"])
+        
+        all_questions = []
+        for i in sorted(questions_by_context):
+            all_questions.extend(questions_by_context[i])
+        
+        response = {
             "success": True,
             "questions": all_questions,
             "total_generated": len(all_questions),
-            "contexts_processed": len(contexts)
-        })
+            "contexts_processed": len(contexts),
+            "peak_rss_mb": memory_usage.peak_mb
+        }
+        if timed_out:
+            response["contexts_timed_out"] = sorted(timed_out)
+        if rejected:
+            response["contexts_rejected"] = sorted(rejected)
+        if failed:
+            response["contexts_failed"] = sorted(failed)
+        return jsonify(response)
         
+    except Overloaded as e:
+        return overloaded_response(e)
     except Exception as e:
         logging.error(f"Error in generate_batch_questions endpoint: {e}")
+        g.error_type = type(e).__name__
+        return jsonify({"error": "Internal server error"}), 500
+
+@app.route('/cache/warm', methods=['POST'])
+def warm_cache():
+    """Pre-generate questions for documents so later quiz requests hit the cache"""
+    try:
+        not_ready = model_not_ready()
+        if not_ready:
+            return not_ready
+        
+        data = request.get_json()
+        
+        if not data or 'contexts' not in data:
+            return jsonify({"error": "Missing required field: contexts"}), 400
+        
+        contexts = data['contexts']
+        
+        if not isinstance(contexts, list) or len(contexts) == 0:
+            return jsonify({"error": "Contexts must be a non-empty list"}), 400
+        
+        if question_generator.question_cache is None:
+            return jsonify({"error": "Question cache is disabled"}), 400
+        
+        chunks_processed = 0
+        questions_cached = 0
+        # Each document's model work then waits for a batch slot of its own
+        admission.check(BATCH)
+        with measure_peak_rss() as memory_usage:
+            for context in contexts:
+                if context.strip():
+                    result = question_generator.warm_cache(context)
+                    chunks_processed += result["chunks"]
+                    questions_cached += result["questions"]
+        
+        return jsonify({
+            "success": True,
+            "contexts_processed": len(contexts),
+            "chunks_processed": chunks_processed,
+            "questions_cached": questions_cached,
+            "peak_rss_mb": memory_usage.peak_mb,
+            "cache": question_generator.question_cache.stats()
+        })
+        
+    except Overloaded as e:
+        return overloaded_response(e)
+    except Exception as e:
+        logging.error(f"Error in warm_cache endpoint: {e}")
+        g.error_type = type(e).__name__
         return jsonify({"error": "Internal server error"}), 500
 
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=8001, debug=False)
+    parser = argparse.ArgumentParser(description="T5 question generation service")
+    parser.add_argument("--export-snapshot", metavar="PATH",
+                        help="Save the model as a local safetensors snapshot for QG_MODEL_PATH and exit")
+    args = parser.parse_args()
+    
+    if args.export_snapshot:
+        question_generator.load_finished.wait()
+        if not question_generator.ready:
+            raise SystemExit(f"Cannot export snapshot: {question_generator.load_error}")
+        question_generator.export_snapshot(args.export_snapshot)
+        logging.info(f"Snapshot written to {args.export_snapshot}")
+    elif workers > 1:
+        serve_prefork(app, '0.0.0.0', 8001, workers, init_worker, on_worker_exit=mark_worker_dead)
+    else:
+        app.run(host='0.0.0.0', port=8001, debug=False)
 
@@ -0,0 +1,556 @@
+import hashlib
+import json
+import numpy as np
+import torch
+from transformers import AutoTokenizer, AutoModelForSeq2SeqLM
+import logging
+import os
+import re
+import threading
+import time
+from collections import deque
+from contextlib import nullcontext
+from typing import List, Dict, Tuple
+from common.admission import BATCH, INTERACTIVE, Overloaded
+from common.single_flight import SingleFlight
+from concept_index import ChunkAnalysis, DistractorIndex
+from memory_budget import MemoryBudget, is_out_of_memory
+from question_cache import QuestionCache
+from metrics import (BATCH_SIZE, COALESCED_REQUESTS, DECODE_SECONDS, GENERATE_SECONDS, OOM_RETRIES, PADDING_RATIO,
+                     TOKENIZE_SECONDS)
+
+SENTENCE_END = re.compile(r'[.!?]+')
+
+# Tokens kept free in each 512-token encoder window for the "answer: ... context:" prefix
+ANSWER_PREFIX_TOKENS = 32
+
+class T5QuestionGenerator:
+    def __init__(self, max_batch_size: int = None, load: bool = True, inference_backend: str = None, num_threads: int = None):
+        self.model_name = "iarfmoose/t5-base-question-generator"
+        # Optional local pre-serialized (safetensors) snapshot, loaded instead of the hub model
+        self.model_path = os.environ.get("QG_MODEL_PATH")
+        self.tokenizer = None
+        self.model = None
+        # Load state: not_loaded -> loading -> ready | failed
+        self.state = "not_loaded"
+        self.load_error = None
+        self.load_metrics = {}
+        self.load_finished = threading.Event()
+        # Upper bound on (answer, chunk) pairs sent through model.generate at once
+        self.max_batch_size = max_batch_size or int(os.environ.get("QG_MAX_BATCH_SIZE", 8))
+        # Optional cross-request scheduler; when set, all generation goes through it
+        self.scheduler = None
+        # Optional persistent cache of questions keyed by chunk hash
+        self.question_cache = None
+        # Optional admission controller; model work on cache misses runs in one of its slots
+        self.admission = None
+        # Identical requests arriving while one is being generated share its result
+        self.single_flight = SingleFlight() if os.environ.get("QG_COALESCE", "1") != "0" else None
+        self.generation_params = {"max_length": 64, "temperature": 0.7, "do_sample": True}
+        self.device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+        # eager (fp32), int8 (dynamic quantization of Linear layers) or compile (torch.compile)
+        self.inference_backend = inference_backend or os.environ.get("QG_INFERENCE_BACKEND", "eager")
+        # Intra-op threads for CPU inference; 0 keeps torch's default
+        self.num_threads = num_threads if num_threads is not None else int(os.environ.get("QG_NUM_THREADS", 0))
+        # Tokens repeated from the end of one chunk at the start of the next
+        self.chunk_overlap = int(os.environ.get("QG_CHUNK_OVERLAP", 0))
+        # Activation memory allowed for the model batches in flight; 0 sizes batches by max_batch_size alone.
+        # The per-token starting estimate is what t5-base measures on CPU and is refined as batches run.
+        self.memory = MemoryBudget(
+            int(os.environ.get("QG_MEMORY_BUDGET_MB", 0)) * 1024 * 1024,
+            float(os.environ.get("QG_BYTES_PER_TOKEN", 128 * 1024)),
+            recover_batches=int(os.environ.get("QG_OOM_RECOVER_BATCHES", 32))
+        )
+        if load:
+            self.load_model()
+    
+    @property
+    def ready(self) -> bool:
+        return self.state == "ready"
+    
+    def load_model(self):
+        """Load the T5 question generation model"""
+        source = self.model_path or self.model_name
+        try:
+            self.state = "loading"
+            logging.info(f"Loading T5 question generation model from {source}...")
+            started = time.monotonic()
+            
+            self.tokenizer = AutoTokenizer.from_pretrained(source)
+            tokenizer_loaded = time.monotonic()
+            
+            # Stream weights straight into place instead of materializing a random init first
+            self.model = AutoModelForSeq2SeqLM.from_pretrained(source, low_cpu_mem_usage=True)
+            self.model.to(self.device)
+            self.model.eval()
+            self.apply_inference_backend()
+            finished = time.monotonic()
+            
+            self.load_metrics = {
+                "source": source,
+                "inference_backend": self.inference_backend,
+                "num_threads": torch.get_num_threads(),
+                "tokenizer_load_seconds": round(tokenizer_loaded - started, 3),
+                "model_load_seconds": round(finished - tokenizer_loaded, 3),
+                "total_load_seconds": round(finished - started, 3)
+            }
+            self.state = "ready"
+            logging.info(f"Model loaded successfully in {self.load_metrics['total_load_seconds']}s!")
+        except Exception as e:
+            self.state = "failed"
+            self.load_error = str(e)
+            logging.error(f"Error loading model: {e}")
+            raise e
+        finally:
+            self.load_finished.set()
+    
+    def apply_inference_backend(self):
+        """Set intra-op parallelism and quantize or compile the loaded model"""
+        if self.num_threads:
+            torch.set_num_threads(self.num_threads)
+        
+        if self.inference_backend == "int8":
+            if self.device.type != "cpu":
+                raise ValueError("int8 dynamic quantization is only supported on CPU")
+            # Weights are stored as int8 and activations quantized on the fly, roughly halving resident memory
+            self.model = torch.ao.quantization.quantize_dynamic(self.model, {torch.nn.Linear}, dtype=torch.qint8)
+        elif self.inference_backend == "compile":
+            # Shapes vary with batch and input length, so compile once for dynamic shapes
+            self.model.forward = torch.compile(self.model.forward, dynamic=True)
+            # Pay the compilation cost during loading rather than on the first request
+            self.generate_question_texts(["answer: warm up context: Compile the model before serving."])
+        elif self.inference_backend != "eager":
+            raise ValueError(f"Unknown inference backend: {self.inference_backend}")
+    
+    def start_background_load(self) -> threading.Thread:
+        """Load the model on a background thread so the server can bind immediately"""
+        def load():
+            try:
+                self.load_model()
+            except Exception:
+                pass  # Already logged and recorded as the failed state
+        
+        self.state = "loading"
+        thread = threading.Thread(target=load, name="model-loader", daemon=True)
+        thread.start()
+        return thread
+    
+    def export_snapshot(self, path: str):
+        """Save the loaded tokenizer and weights as a local safetensors snapshot for QG_MODEL_PATH
+
+        Export from the eager backend; quantized or compiled models are rebuilt at load time.
+        """
+        self.tokenizer.save_pretrained(path)
+        self.model.save_pretrained(path, safe_serialization=True)
+    
+    def preprocess_text(self, text: str, max_length: int = 512) -> List[str]:
+        """Split the whole text into sentence-aligned chunks that fit the encoder window
+
+        Tokenizes the document once and packs sentences by their token offsets,
+        so the cost is linear in document length. max_length is in tokens and
+        includes room for the answer prefix; sentences longer than a chunk are
+        split at token boundaries.
+        """
+        if self.tokenizer is None or not self.tokenizer.is_fast:
+            return self.preprocess_text_by_characters(text, max_length)
+        
+        budget = max_length - ANSWER_PREFIX_TOKENS
+        overlap = min(self.chunk_overlap, budget // 2)
+        offsets = self.tokenizer(
+            text,
+            add_special_tokens=False,
+            return_offsets_mapping=True,
+            verbose=False
+        )["offset_mapping"]
+        
+        # Token range [first, end) of every sentence, found with one pass over both lists
+        spans = []
+        token = 0
+        for sentence_end in [m.end() for m in SENTENCE_END.finditer(text)] + [len(text)]:
+            first = token
+            while token < len(offsets) and offsets[token][0] < sentence_end:
+                token += 1
+            if token > first:
+                spans.append((first, token))
+        
+        def chunk_text(first: int, end: int) -> str:
+            return " ".join(text[offsets[first][0]:offsets[end - 1][1]].split())
+        
+        chunks = []
+        current = []
+        current_tokens = 0
+        for first, end in spans:
+            length = end - first
+            
+            if length > budget:
+                # A single oversized sentence: flush, then cut it into full windows
+                if current:
+                    chunks.append(chunk_text(current[0][0], current[-1][1]))
+                    current, current_tokens = [], 0
+                for start in range(first, end, budget - overlap):
+                    chunks.append(chunk_text(start, min(start + budget, end)))
+                continue
+            
+            if current and current_tokens + length > budget:
+                chunks.append(chunk_text(current[0][0], current[-1][1]))
+                
+                # Carry trailing sentences into the next chunk, up to the overlap budget
+                carried = 0
+                keep = len(current)
+                while keep > 0 and carried + (current[keep - 1][1] - current[keep - 1][0]) <= overlap:
+                    keep -= 1
+                    carried += current[keep][1] - current[keep][0]
+                current, current_tokens = current[keep:], carried
+
+                # Drop carried sentences from the front until the new sentence fits beside them
+                while current and current_tokens + length > budget:
+                    current_tokens -= current[0][1] - current[0][0]
+                    current = current[1:]
+
+            current.append((first, end))
+            current_tokens += length
+        
+        if current:
+            chunks.append(chunk_text(current[0][0], current[-1][1]))
+        
+        return chunks
+    
+    def preprocess_text_by_characters(self, text: str, max_length: int = 512) -> List[str]:
+        """Character-budgeted fallback for tokenizers without offset mappings"""
+        chunks = []
+        current_chunk = []
+        current_length = 0
+        
+        for sentence in SENTENCE_END.split(text):
+            sentence = sentence.strip()
+            if not sentence:
+                continue
+            
+            if current_chunk and current_length + len(sentence) >= max_length:
+                chunks.append(" ".join(current_chunk))
+                current_chunk, current_length = [], 0
+            
+            current_chunk.append(sentence + ".")
+            current_length += len(sentence) + 2
+        
+        if current_chunk:
+            chunks.append(" ".join(current_chunk))
+        
+        return chunks
+    
+    def spread_chunks(self, chunks: List[str], max_questions: int) -> List[str]:
+        """Order chunks so the first ones needed for max_questions are spread over the document"""
+        needed = -(-max_questions // 3)  # Up to 3 questions per chunk
+        if len(chunks) <= needed:
+            return chunks
+        
+        # Evenly spaced chunks in document order first, the rest as fallback if some yield no answers
+        selected = np.unique(np.linspace(0, len(chunks) - 1, needed).round().astype(int))
+        chosen = set(selected.tolist())
+        return [chunks[i] for i in selected] + [chunk for i, chunk in enumerate(chunks) if i not in chosen]
+    
+    def generate_questions_from_text(self, context: str, max_questions: int = 10, num_candidates: int = 1,
+                                     priority: str = INTERACTIVE) -> List[Dict]:
+        """Generate questions from context text
+
+        With num_candidates > 1 each input is encoded once and decoded into
+        that many candidate questions, of which the best ranked is kept.
+        Concurrent calls with the same arguments and priority share one
+        generation, so an interactive call never waits on a batch call's slot.
+        """
+        if self.single_flight is None:
+            return self.build_questions(context, max_questions, num_candidates, priority)
+        
+        key = hashlib.sha256(json.dumps([context, max_questions, num_candidates, priority]).encode("utf-8")).hexdigest()
+        questions, shared = self.single_flight.do(
+            key, lambda: self.build_questions(context, max_questions, num_candidates, priority)
+        )
+        if shared:
+            COALESCED_REQUESTS.inc()
+        return questions
+    
+    def build_questions(self, context: str, max_questions: int, num_candidates: int,
+                        priority: str = INTERACTIVE) -> List[Dict]:
+        """Run the full question pipeline for one context"""
+        try:
+            pairs, analyses = self.plan_questions(context, max_questions)
+            generated = self.resolve_questions(pairs, num_candidates, priority)
+            return self.assemble_questions(pairs, generated, analyses)
+            
+        except Overloaded:
+            # Admission control turned the model work away; the endpoint answers with 429
+            raise
+        except Exception as e:
+            logging.error(f"Error generating questions: {e}")
+            return []
+    
+    def plan_questions(self, context: str, max_questions: int) -> Tuple[List[Tuple[str, str]], Dict[str, ChunkAnalysis]]:
+        """Chunk a context and pick the (answer, chunk) pairs to generate questions for"""
+        chunks = self.spread_chunks(self.preprocess_text(context), max_questions)
+        
+        # Scan each chunk for concepts once; answers and distractors both reuse it
+        analyses = {chunk: ChunkAnalysis(chunk) for chunk in chunks}
+        return self.collect_answer_pairs(chunks, max_questions, analyses), analyses
+    
+    def assemble_questions(self, pairs: List[Tuple[str, str]], generated: List[str],
+                           analyses: Dict[str, ChunkAnalysis]) -> List[Dict]:
+        """Turn generated question texts into multiple choice question objects, one per pair, without deduplicating"""
+        distractor_index = DistractorIndex(analyses)
+        
+        all_questions = []
+        for (answer, chunk), question in zip(pairs, generated):
+            # Generate multiple choice options
+            options = self.generate_mcq_options(answer, chunk, distractor_index)
+            
+            question_obj = {
+                "id": f"q_{len(all_questions) + 1}_{hash(question) % 1000}",
+                "question": question,
+                "type": "multiple_choice",
+                "options": options,
+                "correct_answer": answer,
+                "explanation": f"This question tests understanding of {answer} in the given context.",
+                "difficulty": self.assess_difficulty(question, chunk),
+                "topic": self.extract_topic(chunk)
+            }
+            
+            all_questions.append(question_obj)
+        
+        return all_questions
+    
+    def collect_answer_pairs(self, chunks: List[str], max_questions: int = None,
+                             analyses: Dict[str, ChunkAnalysis] = None) -> List[Tuple[str, str]]:
+        """Collect (answer, chunk) pairs in document order up to max_questions"""
+        pairs = []
+        for chunk in chunks:
+            # Extract potential answers (important nouns, concepts)
+            analysis = analyses.get(chunk) if analyses else None
+            answers = (analysis or ChunkAnalysis(chunk)).key_concepts()
+            
+            for answer in answers[:3]:  # Max 3 answers per chunk
+                if max_questions is not None and len(pairs) >= max_questions:
+                    return pairs
+                pairs.append((answer, chunk))
+        
+        return pairs
+    
+    def chunk_cache_key(self, chunk: str, num_candidates: int = 1) -> str:
+        """Cache key for a chunk under the loaded model, its inference backend and the generation parameters"""
+        # The backend is keyed too, as int8 quantization changes the generated text
+        params = dict(self.generation_params, inference_backend=self.inference_backend)
+        if num_candidates > 1:
+            params["num_candidates"] = num_candidates
+        return QuestionCache.make_key(chunk, self.model_path or self.model_name, params)
+    
+    def resolve_questions(self, pairs: List[Tuple[str, str]], num_candidates: int = 1,
+                          priority: str = INTERACTIVE) -> List[str]:
+        """Return a question for each (answer, chunk) pair, running the model only on cache misses
+
+        Repeated pairs are generated once and share a question. With several
+        candidates, one that repeats a question already chosen for any of
+        the pairs is ranked lower.
+        """
+        known = {}
+        if self.question_cache is not None:
+            for chunk in dict.fromkeys(chunk for _, chunk in pairs):
+                known[chunk] = self.question_cache.get(self.chunk_cache_key(chunk, num_candidates)) or {}
+        
+        missing = list(dict.fromkeys(
+            (answer, chunk) for answer, chunk in pairs if answer not in known.get(chunk, {})
+        ))
+        
+        if missing:
+            input_texts = [f"answer: {answer} context: {chunk}" for answer, chunk in missing]
+            # Inside single-flight, so callers joining an identical generation do not hold a slot
+            slot = self.admission.slot(priority, len(missing) * num_candidates) if self.admission is not None else nullcontext()
+            with slot:
+                if self.scheduler is not None:
+                    candidates = self.scheduler.generate(input_texts, num_candidates, priority)
+                else:
+                    candidates = self.generate_question_candidates(input_texts, num_candidates)
+            
+            # Questions already settled for this request, so candidates can avoid repeating them
+            produced = {
+                self.normalize_question(questions[answer])
+                for questions in known.values() for answer in questions
+            }
+            for (answer, chunk), options in zip(missing, candidates):
+                question = self.pick_candidate(options, answer, produced)
+                produced.add(self.normalize_question(question))
+                known.setdefault(chunk, {})[answer] = question
+            
+            if self.question_cache is not None:
+                for chunk in dict.fromkeys(chunk for _, chunk in missing):
+                    self.question_cache.put(self.chunk_cache_key(chunk, num_candidates), known[chunk])
+        
+        return [known[chunk][answer] for answer, chunk in pairs]
+    
+    @staticmethod
+    def normalize_question(question: str) -> str:
+        return " ".join(re.findall(r'\w+', question.lower()))
+    
+    def pick_candidate(self, candidates: List[str], answer: str, produced: set) -> str:
+        """Pick the best of several decoded questions using cheap text heuristics"""
+        if len(candidates) == 1:
+            return candidates[0]
+        
+        def score(question: str) -> float:
+            words = len(question.split())
+            if words == 0:
+                return float("-inf")
+            
+            value = 0.0
+            # A question that contains its own answer gives it away
+            if answer.lower() in question.lower():
+                value -= 2.0
+            if self.normalize_question(question) in produced:
+                value -= 3.0
+            # Prefer questions of a readable length
+            if words < 5:
+                value -= (5 - words) * 0.5
+            elif words > 20:
+                value -= (words - 20) * 0.25
+            if question.rstrip().endswith("?"):
+                value += 0.5
+            return value
+        
+        # max() keeps the first of equally scored candidates, i.e. the most likely decode
+        return max(candidates, key=score)
+    
+    def warm_cache(self, context: str) -> Dict:
+        """Generate and cache questions for every chunk of a document"""
+        chunks = self.preprocess_text(context)
+        pairs = self.collect_answer_pairs(chunks)
+        self.resolve_questions(pairs, priority=BATCH)
+        return {"chunks": len(chunks), "questions": len(pairs)}
+    
+    def generate_question_texts(self, input_texts: List[str]) -> List[str]:
+        """Run T5 over the inputs and return one question per input"""
+        return [candidates[0] for candidates in self.generate_question_candidates(input_texts)]
+    
+    def generate_question_candidates(self, input_texts: List[str], num_candidates: int = 1) -> List[List[str]]:
+        """Run T5 over the inputs in padded batches and decode num_candidates questions per input
+
+        generate() runs the encoder once per input and expands its outputs for
+        the extra sequences, so additional candidates cost decoder passes only.
+        Sampled decoding returns independent samples; greedy configurations
+        switch to beam search and return the top beams. Inputs are batched by
+        token length within the memory budget, and a failed allocation splits
+        the remaining batches at half the size that failed.
+        """
+        if not input_texts:
+            return []
+        params = dict(self.generation_params)
+        if num_candidates > 1 and not params.get("do_sample", False):
+            params["num_beams"] = max(params.get("num_beams", 1), num_candidates)
+        
+        # Tokenize once unpadded; each batch is padded to its own longest input
+        stage_started = time.perf_counter()
+        encoded = self.tokenizer(input_texts, max_length=512, truncation=True)["input_ids"]
+        TOKENIZE_SECONDS.observe(time.perf_counter() - stage_started)
+        
+        # Keep the decoder batch (inputs x candidates) within max_batch_size sequences
+        pending = deque(self.memory.plan_batches([len(ids) for ids in encoded], num_candidates, self.max_batch_size))
+        questions = [None] * len(input_texts)
+        while pending:
+            batch = pending.popleft()
+            try:
+                decoded = self.generate_batch([encoded[i] for i in batch], num_candidates, params)
+            except Exception as e:
+                if not is_out_of_memory(e) or len(batch) == 1:
+                    raise
+                tokens = len(batch) * num_candidates * max(len(encoded[i]) for i in batch)
+                logging.warning(f"Out of memory generating a batch of {len(batch)} inputs ({tokens} tokens), "
+                                f"retrying in smaller batches")
+                OOM_RETRIES.inc()
+                # Caps batches at half the failed size; plan what is left again under the new cap
+                self.memory.record_out_of_memory(tokens)
+                remaining = batch + [i for queued in pending for i in queued]
+                planned = self.memory.plan_batches([len(encoded[i]) for i in remaining], num_candidates, self.max_batch_size)
+                pending = deque([remaining[j] for j in positions] for positions in planned)
+                continue
+            
+            # Outputs are grouped per input: rows [i * k, (i + 1) * k) belong to input i
+            for position, i in enumerate(batch):
+                questions[i] = decoded[position * num_candidates:(position + 1) * num_candidates]
+        
+        return questions
+    
+    def generate_batch(self, batch: List[List[int]], num_candidates: int, params: Dict) -> List[str]:
+        """Pad one batch of token ids, generate within the memory budget and decode every returned sequence"""
+        BATCH_SIZE.observe(len(batch))
+        # The attention mask hides the padding
+        inputs = self.tokenizer.pad({"input_ids": batch}, return_tensors="pt").to(self.device)
+        padded_tokens = inputs["input_ids"].numel()
+        PADDING_RATIO.observe(1 - sum(len(ids) for ids in batch) / padded_tokens)
+        
+        stage_started = time.perf_counter()
+        with self.memory.reserve(padded_tokens * num_candidates), torch.no_grad():
+            outputs = self.model.generate(
+                input_ids=inputs["input_ids"],
+                attention_mask=inputs["attention_mask"],
+                num_return_sequences=num_candidates,
+                pad_token_id=self.tokenizer.pad_token_id,
+                eos_token_id=self.tokenizer.eos_token_id,
+                **params
+            )
+        GENERATE_SECONDS.observe(time.perf_counter() - stage_started)
+        
+        stage_started = time.perf_counter()
+        decoded = self.tokenizer.batch_decode(outputs, skip_special_tokens=True)
+        DECODE_SECONDS.observe(time.perf_counter() - stage_started)
+        return decoded
+    
+    def extract_key_concepts(self, text: str) -> List[str]:
+        """Extract key concepts that can serve as answers"""
+        # Simple extraction - in production, you might use NER or more sophisticated methods
+        return ChunkAnalysis(text).key_concepts()  # Return top 10 concepts
+    
+    def generate_mcq_options(self, correct_answer: str, context: str, distractor_index: DistractorIndex = None) -> List[str]:
+        """Generate plausible multiple choice options"""
+        if distractor_index is not None:
+            # Most related concepts across the document
+            concepts = distractor_index.distractors(correct_answer, context)
+        else:
+            # Extract other concepts from context as distractors
+            concepts = self.extract_key_concepts(context)
+        options = [correct_answer]
+        
+        # Add distractors
+        for concept in concepts:
+            if concept.lower() != correct_answer.lower() and len(options) < 4:
+                options.append(concept)
+        
+        # Fill remaining slots with generic distractors if needed
+        generic_distractors = ["None of the above", "All of the above", "Cannot be determined", "Insufficient information"]
+        
+        while len(options) < 4:
+            for distractor in generic_distractors:
+                if distractor not in options and len(options) < 4:
+                    options.append(distractor)
+                    break
+        
+        return options
+    
+    def assess_difficulty(self, question: str, context: str) -> str:
+        """Assess question difficulty based on various factors"""
+        question_length = len(question.split())
+        context_complexity = len(context.split())
+        
+        if question_length > 15 or context_complexity > 200:
+            return "hard"
+        elif question_length > 10 or context_complexity > 100:
+            return "medium"
+        else:
+            return "easy"
+    
+    def extract_topic(self, text: str) -> str:
+        """Extract the main topic from text"""
+        # Simple topic extraction - could be enhanced with NLP libraries
+        words = text.split()
+        if len(words) > 0:
+            # Look for capitalized words or longer words as potential topics
+            for word in words:
+                if word.istitle() and len(word) > 4:
+                    return word
+        
+        return "General"